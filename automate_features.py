@@ -7,9 +7,14 @@ from sklearn.model_selection import train_test_split
 from sklearn.utils import shuffle
 
 from filters import apply_filters
-from build_network import build_thread_info, create_user_influence_network
-from sampling import balanced_sampling
-from features import compute_features_for_pairs
+from build_network import build_thread_info, create_user_influence_network, load_forums
+from sampling import balanced_sampling, find_eligible_posts
+from indexes import build_forum_index
+from feature_cache import FeatureCache
+from feature_store import FeatureStore
+from kernel_svc import SubsetKernelSVC
+from screening import successive_halving
+from results_store import ResultsStore, cached_result
 
 # === Global Config ===
 ALL_FEATURES = ["NAN", "PNE", "HUB"]         # All possible influence features
@@ -18,6 +23,10 @@ TAO_SUS = 8760 * 3600                        # 1 year (in seconds) for susceptib
 TAO_FOS = 8760 * 3600                        # 1 year (in seconds) for forgettability window
 MAX_PAIRS = 500                              # Limit on (v, v') pairs sampled per run
 FORUM_ID = 2
+SEED = 42
+SCREENING = False                            # Successive halving over subsets with growing sample budgets
+SCREEN_BUDGETS = [100, 250, 500]
+SCREEN_KEEP_FRACTION = 0.5
 
 RESULTS_CSV = "experiment_results_forum2/feature_eval_f1_scores.csv"
 os.makedirs("experiment_results_forum2", exist_ok=True)
@@ -31,11 +40,13 @@ def get_feature_subsets(features):
     return combos
 
 # === Helper: Train SVC and compute F1 on balanced + imbalanced test set ===
-def run_svc_model(feature_cols):
+def run_svc_model(feature_cols, balanced_df=None, imbalanced_df=None):
     try:
-        # Load previously extracted features
-        balanced_df = pd.read_csv("outputs/features_on_balanced.csv")
-        imbalanced_df = pd.read_csv("outputs/features_on_imbalanced.csv")
+        # Load previously extracted features (unless passed in)
+        if balanced_df is None:
+            balanced_df = pd.read_csv("outputs/features_on_balanced.csv")
+        if imbalanced_df is None:
+            imbalanced_df = pd.read_csv("outputs/features_on_imbalanced.csv")
 
         # Train/test split on balanced data (80% train, 20% test)
         train_df, test_df_balanced = train_test_split(
@@ -69,15 +80,21 @@ def run_svc_model(feature_cols):
 if __name__ == "__main__":
     results = []
     feature_combos = get_feature_subsets(ALL_FEATURES)
+    feature_store = FeatureStore()  # full feature matrix per (filters, TAO, sample), computed once
+    store = ResultsStore()          # every finished subset is committed here; a rerun skips them
+
+    # Scan the forum once, fetching the filter flags alongside; every filter set is evaluated against these
+    flags, posts = load_forums([FORUM_ID])[FORUM_ID]
 
     for filters in FILTER_SETS:
         print(f"\n=== [FILTERS: {filters}] Running network + sampling once ===")
 
         # STEP 1: Apply filters to limit users/threads
-        allowed_users, allowed_topics = apply_filters(forum_id=FORUM_ID, active_filters=filters)
+        allowed_users, allowed_topics = apply_filters(forum_id=FORUM_ID, active_filters=filters, flags=flags)
 
         # STEP 2: Build thread info from filtered data
-        thread_info = build_thread_info(forum_id=FORUM_ID, allowed_users=allowed_users, allowed_topics=allowed_topics)
+        thread_info = build_thread_info(forum_id=FORUM_ID, allowed_users=allowed_users, allowed_topics=allowed_topics,
+                                        posts=posts)
         if not thread_info:
             print("No threads after filter. Skipping.")
             continue
@@ -85,52 +102,67 @@ if __name__ == "__main__":
         # STEP 3: Build influence graph (who influenced whom)
         G = create_user_influence_network(thread_info)
 
-        # STEP 4: Sample balanced and imbalanced (v, v′) user pairs
-        balanced_sampling(
-            thread_info=thread_info,
-            G=G,
-            t_sus=TAO_SUS,
-            t_fos=TAO_FOS,
-            max_pairs=MAX_PAIRS
-        )
+        # Rows repeat across subsets, so IAN sets and features are memoized
+        feature_cache = FeatureCache()
+        sampled = {}  # budget currently sampled into outputs/
+        eligibility = {}  # forum index and eligible v posts at TAO_SUS/TAO_FOS, shared by every budget
 
-        # STEP 5: Load sampled datasets once
-        df_balanced = pd.read_csv("outputs/balanced_samples.csv")
-        df_imbalanced = pd.read_csv("outputs/imbalanced_samples.csv")
+        def score(feature_set, max_pairs):
+            # STEP 4–5: Sample balanced and imbalanced (v, v′) user pairs once per budget,
+            # with the feature matrix of ALL_FEATURES for each (from the store when already computed)
+            if sampled.get("max_pairs") != max_pairs:
+                if not eligibility:
+                    eligibility["index"] = build_forum_index(thread_info)
+                    eligibility["eligible"] = find_eligible_posts(thread_info, TAO_SUS, TAO_FOS,
+                                                                  index=eligibility["index"])
+                balanced_sampling(
+                    thread_info=thread_info,
+                    G=G,
+                    t_sus=TAO_SUS,
+                    t_fos=TAO_FOS,
+                    max_pairs=max_pairs,
+                    seed=SEED,
+                    **eligibility
+                )
+                sampled["max_pairs"] = max_pairs
+                for name in ("balanced", "imbalanced"):
+                    samples = pd.read_csv(f"outputs/{name}_samples.csv")
+                    key = FeatureStore.key(samples, G, thread_info, TAO_SUS, TAO_FOS, filters=filters)
+                    sampled[name] = feature_store.features_for(
+                        key, samples, G, thread_info, TAO_SUS, TAO_FOS, ALL_FEATURES,
+                        cache=feature_cache, output_path=f"outputs/features_on_{name}.csv"
+                    )
+                # Per-feature kernel distances of this sample's split, shared by every subset
+                sampled["svc"] = SubsetKernelSVC(sampled["balanced"], sampled["imbalanced"],
+                                                 [f.lower() for f in ALL_FEATURES])
 
-        # STEP 6: Loop through each feature subset (no need to resample)
-        for feature_set in feature_combos:
             feature_cols = [f.lower() for f in feature_set]
-            feature_name = "+".join(feature_set)
-            print(f"\n→ [Evaluating Features: {feature_set}]")
+            print(f"\n→ [Evaluating Features: {feature_set}] max_pairs={max_pairs}")
+
+            # Run SVC on the selected columns of the full matrix (same F1 as run_svc_model)
+            return sampled["svc"].f1(feature_cols)
 
-            # Extract only these features into new CSVs
-            compute_features_for_pairs(
-                df=df_balanced,
-                G=G,
-                thread_info=thread_info,
-                t_sus=TAO_SUS,
-                t_fos=TAO_FOS,
-                output_path="outputs/features_on_balanced.csv"
-            )
-            compute_features_for_pairs(
-                df=df_imbalanced,
-                G=G,
-                thread_info=thread_info,
-                t_sus=TAO_SUS,
-                t_fos=TAO_FOS,
-                output_path="outputs/features_on_imbalanced.csv"
-            )
+        def evaluate(feature_set, max_pairs):
+            config = ResultsStore.config(FORUM_ID, filters, TAO_SUS, TAO_FOS, feature_set, max_pairs, SEED)
+            return cached_result(store, "features", config, lambda: score(feature_set, max_pairs))[0]
 
-            # Run SVC on the selected features
-            f1 = run_svc_model(feature_cols)
+        # STEP 6: Loop through each feature subset (no need to resample), or screen them
+        if SCREENING:
+            screened = successive_halving(feature_combos, evaluate, SCREEN_BUDGETS, SCREEN_KEEP_FRACTION)
+        else:
+            screened = [{"config": fs, "f1_score": evaluate(fs, MAX_PAIRS)} for fs in feature_combos]
 
+        for r in screened:
             # Save result row
-            results.append({
+            row = {
                 "filters": str(filters),
-                "features": feature_name,
-                "f1_score": f1
-            })
+                "features": "+".join(r["config"]),
+                "f1_score": r["f1_score"]
+            }
+            if SCREENING:
+                row["budget"] = r["budget"]
+                row["eliminated_at"] = r["eliminated_at"]
+            results.append(row)
 
     # Final CSV with all scores
     pd.DataFrame(results).to_csv(RESULTS_CSV, index=False)
@@ -148,7 +180,8 @@ if __name__ == "__main__":
 #
 # from filters import apply_filters
 # from build_network import build_thread_info, create_user_influence_network
-# from sampling import balanced_sampling
+# from sampling import balanced_sampling, find_eligible_posts
+from indexes import build_forum_index
 # from features import compute_features_for_pairs
 #
 # # === Configuration ===
@@ -7,9 +7,13 @@ from sklearn.model_selection import train_test_split
 from sklearn.utils import shuffle
 
 from filters import apply_filters
-from build_network import build_thread_info, create_user_influence_network
-from sampling import balanced_sampling
+from build_network import build_thread_info, create_user_influence_network, load_forums
+from sampling import balanced_sampling, find_eligible_posts
+from indexes import build_forum_index
 from features import compute_features_for_pairs
+from tao_sweep import ThresholdSweep
+from screening import successive_halving
+from results_store import ResultsStore, cached_result
 
 # === Config ===
 FILTER_SETS = [[0, 1, 2, 3]]
@@ -19,16 +23,21 @@ FEATURES_USED = ["nan", "pne", "hub"]
 RESULTS_CSV = "experiment_results_forum2/tao_eval_f1_scores.csv"
 NEG_STATS_CSV = "experiment_results_forum2/avg_negatives_per_positive.csv"
 FORUM_ID = 2
+SEED = 42
+USE_SWEEP = True  # Index the whole TAO grid once (ThresholdSweep) instead of re-sampling per point
+SCREENING = False  # Successive halving: score all points on small budgets, keep the best for larger ones
+SCREEN_BUDGETS = [100, 250, 500]
+SCREEN_KEEP_FRACTION = 0.5
 
 # Create result directories
 os.makedirs("experiment_results_forum2", exist_ok=True)
 os.makedirs("outputs", exist_ok=True)
 
 # === Helper: Run SVC and compute F1 score ===
-def run_svc_model(feature_cols):
+def run_svc_model(feature_cols, output_dir="outputs"):
     try:
-        balanced_df = pd.read_csv("outputs/features_on_balanced.csv")
-        imbalanced_df = pd.read_csv("outputs/features_on_imbalanced.csv")
+        balanced_df = pd.read_csv(os.path.join(output_dir, "features_on_balanced.csv"))
+        imbalanced_df = pd.read_csv(os.path.join(output_dir, "features_on_imbalanced.csv"))
 
         train_df, test_df_balanced = train_test_split(
             balanced_df, test_size=0.2, stratify=balanced_df['label'], random_state=42
@@ -57,83 +66,152 @@ def run_svc_model(feature_cols):
         return None
 
 
+# === Helper: Sample, extract features and score one TAO point ===
+def evaluate_tao_point(thread_info, G, sweep, t_sus_days, t_fos_days, max_pairs, output_dir="outputs",
+                       features=None, seed=SEED, index=None, eligible=None):
+    t_sus = t_sus_days * 24 * 3600  # convert to seconds
+    t_fos = t_fos_days * 24 * 3600
+
+    samples = {
+        "balanced_output": os.path.join(output_dir, "balanced_samples.csv"),
+        "imbalanced_output": os.path.join(output_dir, "imbalanced_samples.csv"),
+        "negatives_output": os.path.join(output_dir, "negatives_per_positive.csv"),
+    }
+
+    # Run sampling (same samples either way for a given seed)
+    if sweep is not None:
+        sweep.sample(t_sus, t_fos, max_pairs=max_pairs, **samples)
+    else:
+        balanced_sampling(
+            thread_info=thread_info,
+            G=G,
+            t_sus=t_sus,
+            t_fos=t_fos,
+            max_pairs=max_pairs,
+            seed=seed,
+            index=index,
+            eligible=eligible,
+            **samples
+        )
+
+    # Load sampled data
+    df_balanced = pd.read_csv(samples["balanced_output"])
+    df_imbalanced = pd.read_csv(samples["imbalanced_output"])
+
+    # Compute features
+    compute_features_for_pairs(
+        df=df_balanced,
+        G=G,
+        thread_info=thread_info,
+        t_sus=t_sus,
+        t_fos=t_fos,
+        output_path=os.path.join(output_dir, "features_on_balanced.csv")
+    )
+
+    compute_features_for_pairs(
+        df=df_imbalanced,
+        G=G,
+        thread_info=thread_info,
+        t_sus=t_sus,
+        t_fos=t_fos,
+        output_path=os.path.join(output_dir, "features_on_imbalanced.csv")
+    )
+
+    # Compute average negatives per positive
+    try:
+        neg_counts = pd.read_csv(samples["negatives_output"])
+        avg_neg_per_pos = round(neg_counts['negatives_count'].mean(), 2)
+    except Exception as e:
+        print(f"[NegStat Warning] Could not compute negatives per positive: {e}")
+        avg_neg_per_pos = 0.0
+
+    # Evaluate model
+    return run_svc_model(FEATURES_USED if features is None else features, output_dir), avg_neg_per_pos
+
+
 # === Run TAO Evaluation Loop ===
 if __name__ == "__main__":
     results = []
     neg_stats = []
+    store = ResultsStore()  # every finished point is committed here; a rerun skips them
+
+    # Scan the forum once, fetching the filter flags alongside; every filter set is evaluated against these
+    flags, posts = load_forums([FORUM_ID])[FORUM_ID]
 
     for filters in FILTER_SETS:
         print(f"\n=== [FILTERS: {filters}] Initializing Graph and Threads ===")
-        allowed_users, allowed_topics = apply_filters(forum_id=FORUM_ID, active_filters=filters)
-        thread_info = build_thread_info(forum_id=FORUM_ID, allowed_users=allowed_users, allowed_topics=allowed_topics)
+        allowed_users, allowed_topics = apply_filters(forum_id=FORUM_ID, active_filters=filters, flags=flags)
+        thread_info = build_thread_info(forum_id=FORUM_ID, allowed_users=allowed_users, allowed_topics=allowed_topics,
+                                        posts=posts)
 
         if not thread_info:
             print("No valid threads found. Skipping filter:", filters)
             continue
 
         G = create_user_influence_network(thread_info)
-
-        for t_sus_days, t_fos_days in itertools.product(TAO_DAYS, TAO_DAYS):
-            t_sus = t_sus_days * 24 * 3600  # convert to seconds
-            t_fos = t_fos_days * 24 * 3600
-
-            print(f"\n→ [Filters: {filters}] TAO: t_sus={t_sus_days}d, t_fos={t_fos_days}d")
-
-            # Run sampling
-            balanced_sampling(
-                thread_info=thread_info,
-                G=G,
-                t_sus=t_sus,
-                t_fos=t_fos,
-                max_pairs=MAX_PAIRS
-            )
-
-            # Load sampled data
-            df_balanced = pd.read_csv("outputs/balanced_samples.csv")
-            df_imbalanced = pd.read_csv("outputs/imbalanced_samples.csv")
-
-            # Compute features
-            compute_features_for_pairs(
-                df=df_balanced,
-                G=G,
-                thread_info=thread_info,
-                t_sus=t_sus,
-                t_fos=t_fos,
-                output_path="outputs/features_on_balanced.csv"
-            )
-
-            compute_features_for_pairs(
-                df=df_imbalanced,
-                G=G,
-                thread_info=thread_info,
-                t_sus=t_sus,
-                t_fos=t_fos,
-                output_path="outputs/features_on_imbalanced.csv"
-            )
-
-            # Compute average negatives per positive
-            try:
-                neg_counts = pd.read_csv("outputs/negatives_per_positive.csv")
-                avg_neg_per_pos = round(neg_counts['negatives_count'].mean(), 2)
-            except Exception as e:
-                print(f"[NegStat Warning] Could not compute negatives per positive: {e}")
-                avg_neg_per_pos = 0.0
-
-            # Evaluate model
-            f1 = run_svc_model(FEATURES_USED)
-
-            results.append({
+        tao_points = list(itertools.product(TAO_DAYS, TAO_DAYS))
+        budgets = SCREEN_BUDGETS if SCREENING else [MAX_PAIRS]
+
+        # The sweep is only indexed once a point actually needs sampling
+        sweeps = {}
+
+        def get_sweep():
+            if USE_SWEEP and not sweeps:
+                tao_grid = [(s * 24 * 3600, f * 24 * 3600) for s, f in tao_points]
+                sweeps["sweep"] = ThresholdSweep(thread_info, G, tao_grid, max_pairs=max(budgets), seed=SEED)
+            return sweeps.get("sweep")
+
+        # Without the sweep, eligible v posts are found once per TAO point and reused at every budget
+        eligible_posts = {}  # TAO point → find_eligible_posts output, plus the shared forum "index"
+
+        def get_eligible(tao_point):
+            if "index" not in eligible_posts:
+                eligible_posts["index"] = build_forum_index(thread_info)
+            if tao_point not in eligible_posts:
+                t_sus_days, t_fos_days = tao_point
+                eligible_posts[tao_point] = find_eligible_posts(thread_info, t_sus_days * 24 * 3600,
+                                                                t_fos_days * 24 * 3600, index=eligible_posts["index"])
+            return {"index": eligible_posts["index"], "eligible": eligible_posts[tao_point]}
+
+        last_neg_stat = {}
+
+        def evaluate(tao_point, max_pairs):
+            t_sus_days, t_fos_days = tao_point
+            print(f"\n→ [Filters: {filters}] TAO: t_sus={t_sus_days}d, t_fos={t_fos_days}d, max_pairs={max_pairs}")
+            config = ResultsStore.config(FORUM_ID, filters, t_sus_days * 24 * 3600, t_fos_days * 24 * 3600,
+                                         FEATURES_USED, max_pairs, SEED)
+
+            def run():
+                sweep = get_sweep()
+                return evaluate_tao_point(thread_info, G, sweep, t_sus_days, t_fos_days, max_pairs,
+                                          **({} if sweep is not None else get_eligible(tao_point)))
+
+            f1, last_neg_stat[tao_point] = cached_result(store, "tao", config, run)
+            return f1
+
+        if SCREENING:
+            screened = successive_halving(tao_points, evaluate, SCREEN_BUDGETS, SCREEN_KEEP_FRACTION)
+        else:
+            screened = [{"config": p, "f1_score": evaluate(p, MAX_PAIRS)} for p in tao_points]
+
+        for r in screened:
+            t_sus_days, t_fos_days = r["config"]
+            row = {
                 "filters": str(filters),
                 "t_sus": t_sus_days,
                 "t_fos": t_fos_days,
-                "f1_score": f1
-            })
+                "f1_score": r["f1_score"]
+            }
+            if SCREENING:
+                row["budget"] = r["budget"]
+                row["eliminated_at"] = r["eliminated_at"]
+            results.append(row)
 
             neg_stats.append({
                 "filters": str(filters),
                 "t_sus": t_sus_days,
                 "t_fos": t_fos_days,
-                "avg_negatives_per_positive": avg_neg_per_pos
+                "avg_negatives_per_positive": last_neg_stat[r["config"]]
             })
 
     # Save results
@@ -1,76 +1,308 @@
-from connect import get_q
-from collections import defaultdict
+from connect import (get_q, stream_q, parallel_copy_q, snapshot_q, snapshots_enabled, run_concurrent,
+                     STREAM_CHUNK_SIZE)
+from filters import filtered_posts_query, scope_params, load_filter_flags
+from thread_store import ThreadInfo
+from indexes import to_seconds
+from collections import deque, namedtuple
+import numpy as np
+import pandas as pd
 import networkx as nx
 import matplotlib.pyplot as plt
 import random
 
 
-# Build thread info structure
-def build_thread_info(forum_id, allowed_users=None, allowed_topics=None):
-    query = """
-        SELECT p.post_id, p.topic_id, p.user_id, p.dateadded_post
-        FROM posts p
-        JOIN topics t ON p.topic_id = t.topic_id
-        WHERE t.forum_id = %s
-          AND LENGTH(p.content_post) > 10
-          AND t.classification_topic >= 0.5
-        ORDER BY p.topic_id, p.dateadded_post;
+# Posts of a forum within the date window [begin, end) (either bound may be NULL);
+# takes filters.scope_params(...) as parameters
+THREAD_POSTS_QUERY = """
+    SELECT p.post_id, p.topic_id, p.user_id, p.dateadded_post
+    FROM posts p
+    JOIN topics t ON p.topic_id = t.topic_id
+    WHERE t.forum_id = %(forum_id)s
+      AND LENGTH(p.content_post) > 10
+      AND t.classification_topic >= 0.5
+      AND (%(begin)s IS NULL OR p.dateadded_post >= %(begin)s)
+      AND (%(end)s IS NULL OR p.dateadded_post < %(end)s)
+    ORDER BY p.topic_id, p.dateadded_post;
+"""
+
+# Same posts restricted to one inclusive topic_id range (%(lo)s, %(hi)s), for partitioned bulk export
+THREAD_POSTS_RANGE_QUERY = """
+    SELECT p.post_id, p.topic_id, p.user_id, p.dateadded_post
+    FROM posts p
+    JOIN topics t ON p.topic_id = t.topic_id
+    WHERE t.forum_id = %(forum_id)s
+      AND LENGTH(p.content_post) > 10
+      AND t.classification_topic >= 0.5
+      AND (%(begin)s IS NULL OR p.dateadded_post >= %(begin)s)
+      AND (%(end)s IS NULL OR p.dateadded_post < %(end)s)
+      AND t.topic_id BETWEEN %(lo)s AND %(hi)s
+    ORDER BY p.topic_id, p.dateadded_post;
+"""
+
+# Inclusive topic_id ranges holding roughly equal numbers of the forum's topics
+TOPIC_RANGES_QUERY = """
+    SELECT MIN(topic_id) AS lo, MAX(topic_id) AS hi
+    FROM (
+        SELECT topic_id, NTILE(%s) OVER (ORDER BY topic_id) AS part
+        FROM topics
+        WHERE forum_id = %s AND classification_topic >= 0.5
+    ) parts
+    GROUP BY part
+    ORDER BY part;
+"""
+
+# Number of topic_id ranges (and concurrent connections) used by bulk=True loads
+BULK_PARTITIONS = 4
+
+# Columnar view of the forum's posts, grouped by thread.
+# Posts of topic_ids[i] live in the slice offsets[i]:offsets[i + 1] of the post arrays,
+# sorted by time; times are int64 epoch seconds.
+ThreadArrays = namedtuple("ThreadArrays", ["topic_ids", "offsets", "post_ids", "user_ids", "times"])
+
+
+def _filter_and_group(df, allowed_users=None, allowed_topics=None):
+    """
+    Vectorized filter by allowed users/topics, then stable sort by (topic, time).
+    Returns the filtered frame and its ThreadArrays.
+    """
+    mask = np.ones(len(df), dtype=bool)
+    if allowed_topics:
+        mask &= df['topic_id'].isin(allowed_topics).to_numpy()
+    if allowed_users:
+        mask &= df['user_id'].isin(allowed_users).to_numpy()
+    df = df[mask]
+
+    times = df['dateadded_post'].to_numpy().astype('datetime64[s]').astype(np.int64)
+    topics = df['topic_id'].to_numpy(dtype=np.int64)
+    order = np.lexsort((times, topics))
+    df = df.iloc[order]
+
+    topics = topics[order]
+    starts = np.flatnonzero(np.diff(topics, prepend=topics[:1] - 1)) if len(topics) else np.zeros(0, dtype=np.int64)
+    arrays = ThreadArrays(
+        topic_ids=topics[starts],
+        offsets=np.append(starts, len(topics)).astype(np.int64),
+        post_ids=df['post_id'].to_numpy(dtype=np.int64),
+        user_ids=df['user_id'].to_numpy(dtype=np.int64),
+        times=times[order],
+    )
+    return df, arrays
+
+
+def _posts_query(active_filters=None, topic_range=False):
+    """
+    THREAD_POSTS_QUERY, or with active_filters the database-side filtered_posts_query.
+    topic_range adds the %(lo)s..%(hi)s topic_id range used by bulk partitions.
+    """
+    if not active_filters:
+        return THREAD_POSTS_RANGE_QUERY if topic_range else THREAD_POSTS_QUERY
+    query = filtered_posts_query(active_filters)
+    if topic_range:
+        query = query.replace("WHERE TRUE", "WHERE fp.topic_id BETWEEN %(lo)s AND %(hi)s", 1)
+    return query
+
+
+def load_posts_streamed(forum_id, allowed_users=None, allowed_topics=None, chunk_size=STREAM_CHUNK_SIZE,
+                        active_filters=None, scope=None):
+    """
+    Fetch the forum's posts through a server-side cursor, filtering each chunk and keeping
+    only typed columns (int64 ids, datetime64 times), so the full result is never held as
+    Python row tuples. Returns a frame with the same columns as get_q, or None on error.
+    """
+    columns = {"post_id": [], "topic_id": [], "user_id": [], "dateadded_post": []}
+    chunks = stream_q(_posts_query(active_filters), params=scope_params(forum_id, scope), chunk_size=chunk_size)
+
+    for chunk in chunks:
+        mask = np.ones(len(chunk), dtype=bool)
+        if allowed_topics:
+            mask &= chunk['topic_id'].isin(allowed_topics).to_numpy()
+        if allowed_users:
+            mask &= chunk['user_id'].isin(allowed_users).to_numpy()
+        chunk = chunk[mask]
+
+        for name in ("post_id", "topic_id", "user_id"):
+            columns[name].append(chunk[name].to_numpy(dtype=np.int64))
+        columns["dateadded_post"].append(pd.to_datetime(chunk["dateadded_post"]).to_numpy())
+
+    if not columns["post_id"]:
+        return None
+    return pd.DataFrame({name: np.concatenate(parts) for name, parts in columns.items()})
+
+
+def load_posts_bulk(forum_id, partitions=BULK_PARTITIONS, active_filters=None, scope=None):
+    """
+    Export the forum's posts with COPY, split into topic_id ranges that are fetched over
+    concurrent connections and decoded straight into typed columns.
+    """
+    ranges = get_q(TOPIC_RANGES_QUERY, params=(partitions, forum_id), bulk=False)
+    if ranges is None or ranges.empty:
+        return None
+
+    params = scope_params(forum_id, scope)
+    param_sets = [{**params, "lo": int(lo), "hi": int(hi)} for lo, hi in zip(ranges['lo'], ranges['hi'])]
+    return parallel_copy_q(_posts_query(active_filters, topic_range=True), param_sets, workers=partitions)
+
+
+def load_posts(forum_id, stream=False, bulk=False, snapshot=None, scope=None):
     """
+    The forum's posts (post_id, topic_id, user_id, dateadded_post) in the scope's date window
+    (default: DATE.BEGIN/END from config.yaml), before user/topic filtering.
+    Load once and pass as posts= to filters.apply_filters and build_thread_info so every
+    filter set of a run is evaluated against the same single scan of the forum.
+    """
+    return _load_posts(forum_id, stream=stream, bulk=bulk, snapshot=snapshot, scope=scope)
+
+
+def load_forums(forum_ids, scope=None, workers=4, stream=False, bulk=False, snapshot=None):
+    """
+    Fetch the filter flags (filters.load_filter_flags) and the post frame (load_posts) of one or
+    more forums, all at once on pooled connections, with per-query latency printed.
+    Returns {forum_id: (flags, posts)}; pass them on as apply_filters(..., flags=flags) and
+    build_thread_info(..., posts=posts).
+    """
+    tasks = {}
+    for forum_id in forum_ids:
+        tasks[(forum_id, "filter flags")] = lambda f=forum_id: load_filter_flags(f, scope)
+        tasks[(forum_id, "posts")] = lambda f=forum_id: load_posts(f, stream, bulk, snapshot, scope)
+
+    results = run_concurrent(tasks, workers=workers)
+    return {forum_id: (results[(forum_id, "filter flags")], results[(forum_id, "posts")]) for forum_id in forum_ids}
+
 
-    df = get_q(query, params=(forum_id,))
+def _load_posts(forum_id, allowed_users=None, allowed_topics=None, stream=False, bulk=False, posts=None,
+                snapshot=None, active_filters=None, scope=None):
+    if posts is not None:
+        return posts
+
+    # The (unfiltered by allowed sets) post query result is snapshotted, whichever way it is fetched
+    if snapshot is None:
+        snapshot = snapshots_enabled()
+    if snapshot:
+        return snapshot_q(_posts_query(active_filters), scope_params(forum_id, scope),
+                          lambda: _load_posts(forum_id, stream=stream, bulk=bulk, snapshot=False,
+                                              active_filters=active_filters, scope=scope))
+
+    if bulk:
+        return load_posts_bulk(forum_id, active_filters=active_filters, scope=scope)
+    if stream:
+        return load_posts_streamed(forum_id, allowed_users, allowed_topics, active_filters=active_filters,
+                                   scope=scope)
+    return get_q(_posts_query(active_filters), params=scope_params(forum_id, scope))
+
+
+def load_thread_arrays(forum_id, allowed_users=None, allowed_topics=None, stream=False, bulk=False, posts=None,
+                       snapshot=None, active_filters=None, scope=None):
+    """
+    Load the forum's posts as ThreadArrays, for callers that consume arrays directly.
+    """
+    df = _load_posts(forum_id, allowed_users, allowed_topics, stream, bulk, posts, snapshot, active_filters, scope)
     if df is None or df.empty:
         print("No data found.")
-        return {}
+        return None
 
-    thread_info = defaultdict(list)
+    _, arrays = _filter_and_group(df, allowed_users, allowed_topics)
+    return arrays
 
-    for _, row in df.iterrows():
-        topic_id = row['topic_id']
-        user_id = row['user_id']
-        post_id = row['post_id']
-        post_time = row['dateadded_post']
 
-        # Apply filters if provided
-        if allowed_topics and topic_id not in allowed_topics:
-            continue
-        if allowed_users and user_id not in allowed_users:
-            continue
+def iter_thread_views(arrays):
+    """
+    Yield (topic_id, post_ids, user_ids, times) per thread; the arrays are slices, not copies.
+    """
+    for i, topic_id in enumerate(arrays.topic_ids.tolist()):
+        start, end = arrays.offsets[i], arrays.offsets[i + 1]
+        yield topic_id, arrays.post_ids[start:end], arrays.user_ids[start:end], arrays.times[start:end]
+
+
+# Build thread info structure
+def build_thread_info(forum_id, allowed_users=None, allowed_topics=None, compact=False, stream=False,
+                      bulk=False, posts=None, snapshot=None, active_filters=None, scope=None):
+    """
+    Returns {topic_id: [(post_id, user_id, timestamp), ...]} sorted by time,
+    or an array-backed ThreadInfo (epoch-second times) when compact=True.
+    With stream=True posts are fetched in chunks through a server-side cursor (see load_posts_streamed);
+    with bulk=True they are exported with parallel, topic-partitioned COPY (see load_posts_bulk);
+    a frame from load_posts can be passed as posts= to skip the database entirely.
+    With snapshot=True (default: DATABASE.SNAPSHOTS) the forum's posts come from a local
+    snapshot while it is current (see connect.snapshot_q).
+    Only posts in the scope's date window are loaded (default: DATE.BEGIN/END from config.yaml);
+    with active_filters the filters and NETWORK thresholds are evaluated in the database too, in
+    place of apply_filters + allowed_users/allowed_topics.
+    """
+    df = _load_posts(forum_id, allowed_users, allowed_topics, stream, bulk, posts, snapshot, active_filters, scope)
+    if df is None or df.empty:
+        print("No data found.")
+        return {}
+
+    df, arrays = _filter_and_group(df, allowed_users, allowed_topics)
+    if compact:
+        return ThreadInfo.from_arrays(arrays)
 
-        thread_info[topic_id].append((post_id, user_id, post_time))
+    post_ids = arrays.post_ids.tolist()
+    user_ids = arrays.user_ids.tolist()
+    post_times = list(df['dateadded_post'])
+    offsets = arrays.offsets.tolist()
 
-    return dict(thread_info)
+    thread_info = {}
+    for i, topic_id in enumerate(arrays.topic_ids.tolist()):
+        start, end = offsets[i], offsets[i + 1]
+        thread_info[topic_id] = list(zip(post_ids[start:end], user_ids[start:end], post_times[start:end]))
+
+    return thread_info
 
 
 # Create influence graph
-def create_user_influence_network(thread_info):
+def create_user_influence_network(thread_info, aggregate=False, max_lag=None):
     """
     Create a directed influence graph from thread info.
     An edge is created from every user who posted before another in the same thread.
     Each edge includes the topic ID, timestamp, post ID, and user ID of the influencer.
+
+    With aggregate=True a DiGraph is built instead, with one edge per (influencer, influenced)
+    pair carrying count (number of post-level edges), first_date and last_date (earliest and
+    latest influencer post time). Use out_degree(weight='count') for multigraph-equivalent degrees.
+
+    With max_lag (seconds, e.g. t_fos) only posts at most max_lag apart are linked, using a sliding
+    window over each thread's time-sorted posts. The number of post-level edges left out is printed
+    and stored in g.graph['pruned_edges'].
     """
+    if aggregate:
+        g = _create_aggregated_network(thread_info, max_lag)
+    else:
+        g = nx.MultiDiGraph()
 
-    g = nx.MultiDiGraph()
+        for topic_id, posts in thread_info.items():
+            posts = sorted(posts, key=lambda x: x[2])  # sort by timestamp (index 2)
+            times = [to_seconds(p[2]) for p in posts] if max_lag is not None else None
+            left = 0
 
-    for topic_id, posts in thread_info.items():
-        posts = sorted(posts, key=lambda x: x[2])  # sort by timestamp (index 2)
+            for i in range(len(posts)):
+                post_id_i, user_i, time_i = posts[i]
+                g.add_node(user_i)
 
-        for i in range(len(posts)):
-            post_id_i, user_i, time_i = posts[i]
-            g.add_node(user_i)
+                if max_lag is not None:
+                    while times[i] - times[left] > max_lag:
+                        left += 1
 
-            for j in range(i):
-                post_id_j, user_j, time_j = posts[j]
-                if user_i != user_j:
-                    g.add_edge(
-                        user_j, user_i,
-                        topic=topic_id,
-                        date=time_j,
-                        from_post=post_id_j,
-                        from_user=user_j
-                    )
+                for j in range(left, i):
+                    post_id_j, user_j, time_j = posts[j]
+                    if user_i != user_j:
+                        g.add_edge(
+                            user_j, user_i,
+                            topic=topic_id,
+                            date=time_j,
+                            from_post=post_id_j,
+                            from_user=user_j
+                        )
 
     print(f"Graph built: {g.number_of_nodes()} users, {g.number_of_edges()} connections.")
 
+    if max_lag is not None:
+        total = _count_post_level_edges(thread_info)
+        kept = g.size(weight='count') if aggregate else g.number_of_edges()
+        g.graph['pruned_edges'] = int(total - kept)
+        print(f"Time window {max_lag}s: kept {int(kept)} of {total} post-level edges "
+              f"({g.graph['pruned_edges']} pruned).")
+
     if len(g.nodes) <= 20:
         nx.draw(g, with_labels=True, node_size=600, font_size=8)
         plt.title("Influence Graph")
@@ -79,12 +311,163 @@ def create_user_influence_network(thread_info):
     return g
 
 
+def _count_post_level_edges(thread_info):
+    """
+    Number of post-level edges the unwindowed graph would have: every earlier post by another user.
+    """
+    total = 0
+    for posts in thread_info.values():
+        posts_by_user = {}
+        for i, (_, user_id, _) in enumerate(sorted(posts, key=lambda x: x[2])):
+            total += i - posts_by_user.get(user_id, 0)
+            posts_by_user[user_id] = posts_by_user.get(user_id, 0) + 1
+    return total
+
+
+def _create_aggregated_network(thread_info, max_lag=None):
+    """
+    One pass per thread, keeping for every user in the current window their post times,
+    so each post is linked to distinct earlier users rather than to every earlier post.
+    """
+    edges = {}
+    g = nx.DiGraph()
+
+    for topic_id, posts in thread_info.items():
+        posts = sorted(posts, key=lambda x: x[2])
+        window = {}  # user → deque of their post times inside the window
+        left = 0
+
+        for post_id_i, user_i, time_i in posts:
+            g.add_node(user_i)
+
+            if max_lag is not None:
+                t_i = to_seconds(time_i)
+                while t_i - to_seconds(posts[left][2]) > max_lag:
+                    user_left = posts[left][1]
+                    window[user_left].popleft()
+                    if not window[user_left]:
+                        del window[user_left]
+                    left += 1
+
+            for user_j, times_j in window.items():
+                if user_j == user_i:
+                    continue
+                edge = edges.get((user_j, user_i))
+                if edge is None:
+                    edges[(user_j, user_i)] = [len(times_j), times_j[0], times_j[-1]]
+                else:
+                    edge[0] += len(times_j)
+                    edge[1] = min(edge[1], times_j[0])
+                    edge[2] = max(edge[2], times_j[-1])
+
+            window.setdefault(user_i, deque()).append(time_i)
+
+    g.add_edges_from(
+        (u, v, {'count': count, 'first_date': first, 'last_date': last})
+        for (u, v), (count, first, last) in edges.items()
+    )
+    return g
+
+
+EDGE_AGGREGATE_QUERY = """
+    WITH fp AS (
+        SELECT p.post_id, p.topic_id, p.user_id, p.dateadded_post
+        FROM posts p
+        JOIN topics t ON p.topic_id = t.topic_id
+        WHERE t.forum_id = %(forum_id)s
+          AND LENGTH(p.content_post) > 10
+          AND t.classification_topic >= 0.5
+          {post_filters}
+    )
+    SELECT a.user_id AS from_user, b.user_id AS to_user,
+           MIN(a.dateadded_post) AS first_time, MAX(a.dateadded_post) AS last_time, COUNT(*) AS count
+    FROM fp a
+    JOIN fp b ON a.topic_id = b.topic_id
+             AND a.user_id <> b.user_id
+             AND (a.dateadded_post, a.post_id) < (b.dateadded_post, b.post_id)
+             {lag_filter}
+    GROUP BY a.user_id, b.user_id;
+"""
+
+NODE_QUERY = """
+    SELECT DISTINCT p.user_id
+    FROM posts p
+    JOIN topics t ON p.topic_id = t.topic_id
+    WHERE t.forum_id = %(forum_id)s
+      AND LENGTH(p.content_post) > 10
+      AND t.classification_topic >= 0.5
+      {post_filters};
+"""
+
+
+def _db_post_filters(allowed_users=None, allowed_topics=None, scope=None):
+    # Same date window as build_thread_info
+    params = scope_params(None, scope)
+    clauses = ["AND (%(begin)s IS NULL OR p.dateadded_post >= %(begin)s)",
+               "AND (%(end)s IS NULL OR p.dateadded_post < %(end)s)"]
+    if allowed_users:
+        clauses.append("AND p.user_id = ANY(%(allowed_users)s)")
+        params['allowed_users'] = list(allowed_users)
+    if allowed_topics:
+        clauses.append("AND p.topic_id = ANY(%(allowed_topics)s)")
+        params['allowed_topics'] = list(allowed_topics)
+    return "\n          ".join(clauses), params
+
+
+def load_edge_aggregates(forum_id, allowed_users=None, allowed_topics=None, max_lag=None, scope=None):
+    """
+    Run the influence-edge self-join in PostgreSQL and return one row per (from_user, to_user)
+    with first_time, last_time and count, matching create_user_influence_network(aggregate=True).
+    Posts with equal timestamps are ordered by post_id. max_lag (seconds) keeps only pairs of
+    posts at most that far apart.
+    """
+    post_filters, params = _db_post_filters(allowed_users, allowed_topics, scope)
+    params['forum_id'] = forum_id
+    lag_filter = ""
+    if max_lag is not None:
+        lag_filter = "AND b.dateadded_post - a.dateadded_post <= make_interval(secs => %(max_lag)s)"
+        params['max_lag'] = max_lag
+
+    query = EDGE_AGGREGATE_QUERY.format(post_filters=post_filters, lag_filter=lag_filter)
+    return get_q(query, params=params)
+
+
+def build_network_from_db(forum_id, allowed_users=None, allowed_topics=None, max_lag=None, scope=None):
+    """
+    Build the aggregated influence DiGraph from edges computed in the database,
+    so only one row per user pair is transferred instead of every post.
+    """
+    post_filters, params = _db_post_filters(allowed_users, allowed_topics, scope)
+    params['forum_id'] = forum_id
+    nodes = get_q(NODE_QUERY.format(post_filters=post_filters), params=params)
+    edges = load_edge_aggregates(forum_id, allowed_users, allowed_topics, max_lag, scope)
+    if nodes is None or edges is None:
+        print("No data found.")
+        return nx.DiGraph()
+
+    g = nx.DiGraph()
+    g.add_nodes_from(nodes['user_id'].tolist())
+    g.add_edges_from(
+        (u, v, {'count': count, 'first_date': first, 'last_date': last})
+        for u, v, first, last, count in zip(edges['from_user'].tolist(), edges['to_user'].tolist(),
+                                            edges['first_time'], edges['last_time'],
+                                            edges['count'].tolist())
+    )
+
+    print(f"Graph built in database: {g.number_of_nodes()} users, {g.number_of_edges()} connections.")
+    return g
+
+
 def print_full_network(graph):
     """
     Print all edges in the influence network including post ID, user ID, timestamp, and thread.
     """
     print("=== Influence Network Edges ===")
     for u, v, edge_data in graph.edges(data=True):
+        if 'count' in edge_data:
+            print(f"User {u} → User {v} ({edge_data['count']} posts, "
+                  f"First: {edge_data['first_date']}, Last: {edge_data['last_date']})")
+            continue
         topic = edge_data.get('topic', 'N/A')
         time = edge_data.get('date', 'N/A')
         from_post = edge_data.get('from_post', 'N/A')
@@ -2,7 +2,22 @@ import yaml
 from sys import argv
 
 config = None
-file_path = argv[1] if len(argv) == 2 else "config.yaml"
+
+
+def config_path(args):
+    """
+    Config file named on the command line: `--config PATH`, or a lone YAML argument
+    (python script.py my_config.yaml); config.yaml otherwise. Other arguments, such as
+    experiment_runner's commands, are left to the script.
+    """
+    if "--config" in args:
+        return args[args.index("--config") + 1]
+    if len(args) == 2 and args[1].endswith((".yaml", ".yml")):
+        return args[1]
+    return "config.yaml"
+
+
+file_path = config_path(argv)
 
 
 # config should only need to be called once then can be retrieved by any file.
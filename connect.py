@@ -1,7 +1,16 @@
 import psycopg2
+from psycopg2 import pool
 import yaml
 import pandas as pd
 import os
+import io
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from snapshot import SnapshotStore, SNAPSHOT_DIR
 
 # Automatically find the real project root
 project_root = os.path.dirname(os.path.abspath(__file__))
@@ -31,32 +40,300 @@ def get_db_connection():
         return None
 
 
-# Function to execute a query and return a DataFrame
-def get_q(query, params=None, table_name=None):
-    connection = get_db_connection()
-    if connection is None:
-        return None
+# Shared connection pool (created lazily, re-created in forked child processes)
+_pool = None
+_pool_pid = None
+_pool_slots = None   # bounds concurrent borrowers so extra threads wait instead of exhausting the pool
+_pool_lock = threading.Lock()  # first DB calls may come from several threads at once
+_cursor_ids = itertools.count()
+
+# Rows fetched per round trip by stream_q
+STREAM_CHUNK_SIZE = 50000
+
 
+def get_pool():
+    global _pool, _pool_pid, _pool_slots
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            # Re-check: another thread may have created the pool while this one waited
+            if _pool is None or _pool_pid != os.getpid():
+                new_pool = pool.ThreadedConnectionPool(
+                    db_config.get('POOL_MIN', 1),
+                    db_config.get('POOL_MAX', 8),
+                    host=db_config['HOST'],
+                    database=db_config['DATABASE'],
+                    user=db_config['USER'],
+                    password=db_config['PASSWORD']
+                )
+                _pool_slots = threading.BoundedSemaphore(db_config.get('POOL_MAX', 8))
+                _pool = new_pool
+                _pool_pid = os.getpid()
+    return _pool
+
+
+@contextmanager
+def pooled_connection():
+    """
+    Borrow a connection from the pool, waiting while all POOL_MAX are in use;
+    yields None if the database is unreachable.
+    The transaction is rolled back before the connection goes back to the pool.
+    """
+    try:
+        connection_pool = get_pool()
+    except Exception as error:
+        print(f"Error connecting to database: {error}")
+        yield None
+        return
+
+    slots = _pool_slots
+    slots.acquire()
+    try:
+        connection = connection_pool.getconn()
+    except Exception as error:
+        slots.release()
+        print(f"Error connecting to database: {error}")
+        yield None
+        return
+
+    broken = False
+    try:
+        yield connection
+    except Exception:
+        broken = True
+        raise
+    finally:
+        try:
+            connection.rollback()
+        except Exception:
+            broken = True
+        connection_pool.putconn(connection, close=broken or connection.closed)
+        slots.release()
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.closeall()
+        _pool = None
+
+
+# Staleness marker for snapshots: moves whenever posts are added (or re-dated)
+WATERMARK_QUERY = "SELECT MAX(post_id), MAX(dateadded_post) FROM posts;"
+
+
+def snapshots_enabled():
+    return db_config.get('SNAPSHOTS', False)
+
+
+def posts_watermark():
+    """
+    [max post_id, max dateadded_post] of the posts table, or None if the database is unreachable.
+    """
+    with pooled_connection() as connection:
+        if connection is None:
+            return None
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(WATERMARK_QUERY)
+                max_post_id, max_dateadded = cursor.fetchone()
+            return [max_post_id, str(max_dateadded)]
+        except Exception as error:
+            print(f"Error executing query: {error}")
+            return None
+
+
+def snapshot_q(query, params, fetch):
+    """
+    Result of (query, params) from the local snapshot store if it is still current,
+    otherwise fetch() (any function returning the DataFrame) and snapshot that.
+    If the database is unreachable an existing snapshot is used without the staleness check.
+    """
+    store = SnapshotStore(db_config.get('SNAPSHOT_DIR', SNAPSHOT_DIR))
+    key = store.key(query, params, namespace=f"{db_config['HOST']}/{db_config['DATABASE']}")
+
+    watermark = posts_watermark()
+    if watermark is None:
+        print("Database unreachable; using snapshot without staleness check.")
+    df = store.load(key, watermark)
+    if df is not None:
+        return df
+
+    df = fetch()
+    if df is not None and watermark is not None:
+        store.save(key, df, watermark, query, params)
+    return df
+
+
+# Function to execute a query and return a DataFrame
+def get_q(query, params=None, table_name=None, bulk=None, snapshot=None):
     # Adjust query if a table name or specific field is provided
     if table_name:
         query = query.replace("{table}", table_name)
 
-    try:
-        cursor = connection.cursor()
-        cursor.execute(query, params)
-        # Get column names from the cursor
-        columns = [desc[0] for desc in cursor.description]
-        result = cursor.fetchall()
-        # Convert the result to a pandas DataFrame
-        df = pd.DataFrame(result, columns=columns)
-        return df
-    except Exception as error:
-        print(f"Error executing query: {error}")
+    # Local snapshot of the result, per call or for every query via DATABASE.SNAPSHOTS in config.yaml
+    if snapshot is None:
+        snapshot = snapshots_enabled()
+    if snapshot:
+        return snapshot_q(query, params, lambda: get_q(query, params, bulk=bulk, snapshot=False))
+
+    # COPY-based export, per call or for every query via DATABASE.BULK_EXPORT in config.yaml
+    if bulk is None:
+        bulk = db_config.get('BULK_EXPORT', False)
+    if bulk:
+        return copy_q(query, params)
+
+    with pooled_connection() as connection:
+        if connection is None:
+            return None
+
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(query, params)
+                # Get column names from the cursor
+                columns = [desc[0] for desc in cursor.description]
+                result = cursor.fetchall()
+            # Convert the result to a pandas DataFrame
+            df = pd.DataFrame(result, columns=columns)
+            return df
+        except Exception as error:
+            print(f"Error executing query: {error}")
+            return None
+
+
+# Function to stream a large query in chunks
+def stream_q(query, params=None, table_name=None, chunk_size=STREAM_CHUNK_SIZE, as_arrays=False):
+    """
+    Run the query through a named (server-side) cursor and yield the result in chunks of
+    at most chunk_size rows, as DataFrames or, with as_arrays=True, {column: numpy array} dicts.
+    Only one chunk is held on the client at a time. Stops early (after printing) on errors.
+    """
+    if table_name:
+        query = query.replace("{table}", table_name)
+
+    with pooled_connection() as connection:
+        if connection is None:
+            return
+
+        try:
+            with connection.cursor(name=f"stream_q_{os.getpid()}_{next(_cursor_ids)}") as cursor:
+                cursor.itersize = chunk_size
+                cursor.execute(query, params)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    columns = [desc[0] for desc in cursor.description]
+                    df = pd.DataFrame(rows, columns=columns)
+                    del rows
+                    if as_arrays:
+                        yield {column: df[column].to_numpy() for column in columns}
+                    else:
+                        yield df
+        except Exception as error:
+            print(f"Error executing query: {error}")
+
+
+# PostgreSQL type OIDs decoded by copy_q
+DATE_TYPES = {1082, 1114, 1184}   # date, timestamp, timestamptz
+TEXT_TYPES = {18, 19, 25, 1042, 1043}   # char, name, text, bpchar, varchar
+BOOL_TYPE = 16
+
+
+# Function to export a query with COPY and return a typed DataFrame
+def copy_q(query, params=None):
+    """
+    Run the query as COPY (...) TO STDOUT (CSV) and parse the stream straight into typed
+    columns: integers/floats as numpy dtypes, dates and timestamps as datetime64, booleans as bool.
+    Avoids psycopg2's per-value Python object conversion for large exports.
+    """
+    with pooled_connection() as connection:
+        if connection is None:
+            return None
+
+        try:
+            with connection.cursor() as cursor:
+                sql = cursor.mogrify(query, params).decode().strip().rstrip(";")
+
+                # Column names and types, without fetching rows
+                cursor.execute(f"SELECT * FROM ({sql}) AS q LIMIT 0")
+                columns = [(desc[0], desc[1]) for desc in cursor.description]
+
+                buffer = io.BytesIO()
+                cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv)", buffer)
+            buffer.seek(0)
+
+            return pd.read_csv(
+                buffer,
+                header=None,
+                names=[name for name, _ in columns],
+                dtype={name: str for name, type_code in columns if type_code in TEXT_TYPES},
+                parse_dates=[name for name, type_code in columns if type_code in DATE_TYPES],
+                true_values=["t"],
+                false_values=["f"],
+                keep_default_na=False,
+                na_values=[""],
+            )
+        except Exception as error:
+            print(f"Error executing query: {error}")
+            return None
+
+
+# Function to run one COPY export per parameter set over concurrent connections
+def parallel_copy_q(query, param_sets, workers=4):
+    """
+    copy_q for each entry of param_sets (e.g. one topic_id range per partition) on up to
+    `workers` pooled connections at once. Returns the concatenated frame in param_sets order,
+    or None if any partition failed.
+    """
+    param_sets = list(param_sets)
+    # Never ask for more connections than the pool can hand out
+    workers = max(1, min(workers, len(param_sets), db_config.get('POOL_MAX', 8)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        parts = list(executor.map(lambda params: copy_q(query, params), param_sets))
+
+    if not parts or any(part is None for part in parts):
         return None
-    finally:
-        if connection:
-            cursor.close()
-            connection.close()
+    return pd.concat(parts, ignore_index=True)
+
+
+# Function to run independent loads concurrently
+def run_concurrent(tasks, workers=4, report=True):
+    """
+    Run independent loads at once on pooled connections (one thread each, up to `workers`).
+
+    tasks: {name: (query, params)} for plain get_q queries, or {name: callable} for any other
+    load (e.g. a bulk or streamed post load). Returns {name: result}; with report=True prints
+    each task's latency, slowest first, next to the wall time of the whole batch.
+    """
+    def run(item):
+        name, task = item
+        started = time.perf_counter()
+        result = task() if callable(task) else get_q(*task)
+        return name, result, time.perf_counter() - started
+
+    started = time.perf_counter()
+    workers = max(1, min(workers, len(tasks), db_config.get('POOL_MAX', 8)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        finished = list(executor.map(run, tasks.items()))
+    wall = time.perf_counter() - started
+
+    if report:
+        print(f"=== {len(tasks)} concurrent loads on {workers} connections: {wall:.2f}s wall ===")
+        for name, result, seconds in sorted(finished, key=lambda x: -x[2]):
+            rows = len(result) if hasattr(result, "__len__") else "-"
+            print(f"{seconds:8.2f}s  {rows!s:>10} rows  {name}")
+
+    return {name: result for name, result, _ in finished}
+
+
+# Function to run one query per forum concurrently
+def get_q_forums(query, forum_ids, params_for=lambda forum_id: (forum_id,), workers=4):
+    """
+    {forum_id: DataFrame} for a per-forum query; params_for builds each forum's parameters.
+    """
+    tasks = {forum_id: (query, params_for(forum_id)) for forum_id in forum_ids}
+    return run_concurrent(tasks, workers=workers)
 
 
 # Function for executing simple SELECT queries with optional WHERE clause
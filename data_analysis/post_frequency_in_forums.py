@@ -1,25 +1,27 @@
+import sys
 import psycopg2
 import pandas as pd
 import matplotlib.pyplot as plt
 
-from connect import get_q
+from connect import get_q, get_q_forums
 
-def plot_forum_post_frequency(forum_id, start_date, end_date):
-    query = """
-        SELECT 
-            DATE_TRUNC('month', p.dateadded_post)::DATE AS month,
-            COUNT(p.post_id) AS total_posts
-        FROM posts p
-        JOIN topics t ON p.topic_id = t.topic_id
-        WHERE t.forum_id = %s
-          AND p.dateadded_post >= %s
-          AND p.dateadded_post <= %s
-        GROUP BY month
-        ORDER BY month;
-    """
+QUERY = """
+    SELECT 
+        DATE_TRUNC('month', p.dateadded_post)::DATE AS month,
+        COUNT(p.post_id) AS total_posts
+    FROM posts p
+    JOIN topics t ON p.topic_id = t.topic_id
+    WHERE t.forum_id = %s
+      AND p.dateadded_post >= %s
+      AND p.dateadded_post <= %s
+    GROUP BY month
+    ORDER BY month;
+"""
 
-    # Load data into DataFrame
-    df = get_q(query, params=(forum_id, start_date, end_date))
+def plot_forum_post_frequency(forum_id, start_date, end_date, df=None):
+    # Load data into DataFrame (unless already fetched)
+    if df is None:
+        df = get_q(QUERY, params=(forum_id, start_date, end_date))
 
     if df is None or df.empty:
         print("No data found or there was an error executing the query.")
@@ -46,9 +48,17 @@ def plot_forum_post_frequency(forum_id, start_date, end_date):
 
     plt.show()
 
+# Several forums: queries run concurrently, plots are drawn one forum at a time
+def plot_forums_post_frequency(forum_ids, start_date, end_date, workers=4):
+    dfs = get_q_forums(QUERY, forum_ids, params_for=lambda forum_id: (forum_id, start_date, end_date),
+                       workers=workers)
+    for forum_id, df in dfs.items():
+        plot_forum_post_frequency(forum_id, start_date, end_date, df)
+
 # Specify forum id and dates here
 if __name__ == "__main__":
-    plot_forum_post_frequency(8, '2015-01-01', '2025-03-31')
+    # python post_frequency_in_forums.py [forum_id ...]
+    plot_forums_post_frequency([int(arg) for arg in sys.argv[1:]] or [8], '2015-01-01', '2025-03-31')
 
 
 '''
@@ -1,22 +1,24 @@
+import sys
 import psycopg2
 import pandas as pd
 import matplotlib.pyplot as plt
 
-from connect import get_q
+from connect import get_q, get_q_forums
 
-def plot_posts_per_user_forum(forum_id):
-    query = """
-        SELECT p.user_id, COUNT(p.post_id) AS num_posts
-        FROM posts p
-        JOIN topics t ON p.topic_id = t.topic_id
-        WHERE t.forum_id = %s 
-        AND length(content_post) > 10 AND classification_topic >= 0.5
-        GROUP BY p.user_id
-        HAVING COUNT(p.post_id) > 2;
-    """
+QUERY = """
+    SELECT p.user_id, COUNT(p.post_id) AS num_posts
+    FROM posts p
+    JOIN topics t ON p.topic_id = t.topic_id
+    WHERE t.forum_id = %s 
+    AND length(content_post) > 10 AND classification_topic >= 0.5
+    GROUP BY p.user_id
+    HAVING COUNT(p.post_id) > 2;
+"""
 
+def plot_posts_per_user_forum(forum_id, df=None):
     # Load data into DataFrame
-    df = get_q(query, params=(forum_id,))
+    if df is None:
+        df = get_q(QUERY, params=(forum_id,))
     if df is None or df.empty:
         print("No data found or there was an error executing the query.")
 
@@ -43,6 +45,12 @@ def plot_posts_per_user_forum(forum_id):
     plt.tight_layout()
     plt.show()
 
+# Several forums: queries run concurrently, plots are drawn one forum at a time
+def plot_posts_per_user_forums(forum_ids, workers=4):
+    for forum_id, df in get_q_forums(QUERY, forum_ids, workers=workers).items():
+        plot_posts_per_user_forum(forum_id, df)
+
 # Specify forum id here
 if __name__ == "__main__":
-    plot_posts_per_user_forum(11)
+    # python posts_per_user.py [forum_id ...]
+    plot_posts_per_user_forums([int(arg) for arg in sys.argv[1:]] or [11])
@@ -1,20 +1,22 @@
+import sys
 import pandas as pd
 import matplotlib.pyplot as plt
-from connect import get_q
+from connect import get_q, get_q_forums
+
+QUERY = """
+    SELECT p.user_id, COUNT(DISTINCT p.topic_id) AS thread_count
+    FROM posts p
+    JOIN topics t ON p.topic_id = t.topic_id
+    WHERE t.forum_id = %s
+    AND length(content_post) > 10 AND classification_topic >= 0.5
+    GROUP BY p.user_id
+    HAVING COUNT(DISTINCT p.topic_id) > 2;
+"""
 
 # Counts how many distinct threads each user participates in
-def plot_unique_thread_participation(forum_id):
-    query = """
-        SELECT p.user_id, COUNT(DISTINCT p.topic_id) AS thread_count
-        FROM posts p
-        JOIN topics t ON p.topic_id = t.topic_id
-        WHERE t.forum_id = %s
-        AND length(content_post) > 10 AND classification_topic >= 0.5
-        GROUP BY p.user_id
-        HAVING COUNT(DISTINCT p.topic_id) > 2;
-    """
-
-    df = get_q(query, params=(forum_id,))
+def plot_unique_thread_participation(forum_id, df=None):
+    if df is None:
+        df = get_q(QUERY, params=(forum_id,))
 
     if df is None or df.empty:
         print("No data found or there was an error executing the query.")
@@ -43,6 +45,12 @@ def plot_unique_thread_participation(forum_id):
     plt.tight_layout()
     plt.show()
 
+# Several forums: queries run concurrently, plots are drawn one forum at a time
+def plot_unique_thread_participation_forums(forum_ids, workers=4):
+    for forum_id, df in get_q_forums(QUERY, forum_ids, workers=workers).items():
+        plot_unique_thread_participation(forum_id, df)
+
 # Specify forum id here
 if __name__ == "__main__":
-    plot_unique_thread_participation(11)
+    # python unique_thread_participation_per_user.py [forum_id ...]
+    plot_unique_thread_participation_forums([int(arg) for arg in sys.argv[1:]] or [11])
@@ -1,19 +1,21 @@
+import sys
 import pandas as pd
 import matplotlib.pyplot as plt
-from connect import get_q
-
-def plot_unique_users_per_thread(forum_id):
-    query = """
-        SELECT t.topic_id, COUNT(DISTINCT p.user_id) AS unique_users
-        FROM topics t
-        JOIN posts p ON t.topic_id = p.topic_id
-        WHERE t.forum_id = %s
-        AND length(content_post) > 10 AND classification_topic >= 0.5
-        GROUP BY t.topic_id
-        HAVING COUNT(DISTINCT p.user_id) > 2;
-    """
-
-    df = get_q(query, params=(forum_id,))
+from connect import get_q, get_q_forums
+
+QUERY = """
+    SELECT t.topic_id, COUNT(DISTINCT p.user_id) AS unique_users
+    FROM topics t
+    JOIN posts p ON t.topic_id = p.topic_id
+    WHERE t.forum_id = %s
+    AND length(content_post) > 10 AND classification_topic >= 0.5
+    GROUP BY t.topic_id
+    HAVING COUNT(DISTINCT p.user_id) > 2;
+"""
+
+def plot_unique_users_per_thread(forum_id, df=None):
+    if df is None:
+        df = get_q(QUERY, params=(forum_id,))
 
     if df is None or df.empty:
         print("No data found or there was an error executing the query.")
@@ -43,6 +45,12 @@ def plot_unique_users_per_thread(forum_id):
     plt.tight_layout()
     plt.show()
 
+# Several forums: queries run concurrently, plots are drawn one forum at a time
+def plot_unique_users_per_thread_forums(forum_ids, workers=4):
+    for forum_id, df in get_q_forums(QUERY, forum_ids, workers=workers).items():
+        plot_unique_users_per_thread(forum_id, df)
+
 # Specify forum id here
 if __name__ == "__main__":
-    plot_unique_users_per_thread(2)
+    # python unique_users_per_thread.py [forum_id ...]
+    plot_unique_users_per_thread_forums([int(arg) for arg in sys.argv[1:]] or [2])
@@ -0,0 +1,470 @@
+import hashlib
+import json
+import os
+import shutil
+import socket
+import sys
+import threading
+import time
+import traceback
+
+import pandas as pd
+import yaml
+
+import automate_features
+import automate_tao
+from build_network import build_thread_info, create_user_influence_network, load_forums
+from connect import config as project_config
+from feature_store import FeatureStore
+from filters import apply_filters
+from kernel_svc import SubsetKernelSVC
+from results_store import ResultsStore
+from sampling import balanced_sampling
+from tao_sweep import ThresholdSweep
+
+# Shared queue directory (put it on storage every worker machine mounts)
+QUEUE_DIR = (project_config.get("EXPERIMENTS") or {}).get("QUEUE_DIR", "experiment_queue")
+LEASE_SECONDS = 1800     # A claim not renewed for this long is handed to another worker
+HEARTBEAT_SECONDS = 60   # How often a running task renews its claim
+POLL_SECONDS = 30        # Idle wait of `worker --wait` between empty claims
+
+
+class DirectoryQueue:
+    """
+    Work queue on a (shared) directory, standing in for a message broker.
+
+    Tasks are JSON files moving between pending/, claimed/, done/ and failed/. A claim is an
+    atomic rename out of pending/, so exactly one worker gets each task, on any number of
+    machines sharing the directory. A running task renews its claim (file mtime) every
+    HEARTBEAT_SECONDS; claims older than LEASE_SECONDS (a crashed or killed worker) go back
+    to pending/. Each task writes its files under artifacts/<task_id>/.
+
+    Another broker can replace it by providing put, claim, heartbeat, complete, fail and results.
+    """
+
+    STATES = ("pending", "claimed", "done", "failed")
+
+    def __init__(self, root=QUEUE_DIR, lease=LEASE_SECONDS):
+        self.root = root
+        self.lease = lease
+        for state in self.STATES + ("artifacts",):
+            os.makedirs(os.path.join(root, state), exist_ok=True)
+
+    def _path(self, state, task_id):
+        return os.path.join(self.root, state, f"{task_id}.json")
+
+    def _write(self, path, record):
+        tmp = f"{path}.tmp{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(record, f, indent=1, default=str)
+        os.replace(tmp, path)
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _ids(self, state):
+        return sorted(name[:-5] for name in os.listdir(os.path.join(self.root, state)) if name.endswith(".json"))
+
+    def artifacts(self, task_id):
+        path = os.path.join(self.root, "artifacts", task_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def put(self, task):
+        """
+        Queue a task unless one with its id is already queued, running or finished.
+        """
+        if any(os.path.exists(self._path(state, task["task_id"])) for state in self.STATES):
+            return False
+        self._write(self._path("pending", task["task_id"]), task)
+        return True
+
+    def requeue_stale(self):
+        now = time.time()
+        for task_id in self._ids("claimed"):
+            path = self._path("claimed", task_id)
+            try:
+                if now - os.path.getmtime(path) > self.lease:
+                    os.rename(path, self._path("pending", task_id))
+                    print(f"Requeued stale task {task_id}.")
+            except FileNotFoundError:
+                continue  # completed or requeued by someone else meanwhile
+
+    def claim(self, worker_id):
+        """
+        The next pending task (now owned by worker_id), or None if nothing is pending.
+        """
+        self.requeue_stale()
+        for task_id in self._ids("pending"):
+            pending, claimed = self._path("pending", task_id), self._path("claimed", task_id)
+            try:
+                # Renew the mtime first: rename keeps it, and a task that waited in pending/
+                # longer than the lease would otherwise look stale the moment it is claimed
+                os.utime(pending)
+                os.rename(pending, claimed)
+            except FileNotFoundError:
+                continue  # another worker won this one
+            task = self._read(claimed)
+            if task is None:
+                if os.path.exists(claimed):
+                    self.fail({"task_id": task_id}, "Unreadable task file")
+                continue
+            self._write(claimed, {**task, "worker": worker_id, "claimed_at": time.time()})
+            return task
+        return None
+
+    def heartbeat(self, task_id):
+        try:
+            os.utime(self._path("claimed", task_id))
+        except FileNotFoundError:
+            pass
+
+    def complete(self, task, result):
+        self._write(self._path("done", task["task_id"]), {**task, "result": result, "finished_at": time.time()})
+        self._remove("claimed", task["task_id"])
+
+    def fail(self, task, error):
+        self._write(self._path("failed", task["task_id"]), {**task, "error": error, "finished_at": time.time()})
+        self._remove("claimed", task["task_id"])
+
+    def retry_failed(self):
+        for task_id in self._ids("failed"):
+            task = self._read(self._path("failed", task_id))
+            if task is None or "params" not in task:
+                print(f"Cannot requeue {task_id}: the task file was unreadable.")
+                continue
+            self._remove("failed", task_id)
+            self.put({k: task[k] for k in ("task_id", "kind", "order", "params")})
+            print(f"Requeued failed task {task_id}.")
+
+    def _remove(self, state, task_id):
+        try:
+            os.remove(self._path(state, task_id))
+        except FileNotFoundError:
+            pass
+
+    def results(self):
+        return [self._read(self._path("done", task_id)) for task_id in self._ids("done")]
+
+    def status(self):
+        counts = {state: len(self._ids(state)) for state in self.STATES}
+        print(f"=== Queue {self.root} ===")
+        print("  ".join(f"{state}: {count}" for state, count in counts.items()))
+        for task_id in self._ids("failed"):
+            task = self._read(self._path("failed", task_id))
+            if task is None:
+                # Removed by a concurrent retry, or moved here by claim() because it was unreadable
+                print(f"failed {task_id}: unreadable task file")
+                continue
+            error = (task.get("error") or "").strip().splitlines()
+            print(f"failed {task_id}: {error[-1] if error else 'no error recorded'}")
+        return counts
+
+
+# === Grid spec → tasks ===
+def default_spec():
+    """
+    The grids of automate_tao.py and automate_features.py, as a spec for expand_grid.
+    """
+    return {
+        "tao": {
+            "forum_id": automate_tao.FORUM_ID,
+            "seed": automate_tao.SEED,
+            "filters": automate_tao.FILTER_SETS,
+            "days": automate_tao.TAO_DAYS,
+            "max_pairs": automate_tao.MAX_PAIRS,
+            "features": automate_tao.FEATURES_USED,
+            "sweep": automate_tao.USE_SWEEP,
+        },
+        "features": {
+            "forum_id": automate_features.FORUM_ID,
+            "seed": automate_features.SEED,
+            "filters": automate_features.FILTER_SETS,
+            "features": automate_features.ALL_FEATURES,
+            "t_sus": automate_features.TAO_SUS,
+            "t_fos": automate_features.TAO_FOS,
+            "max_pairs": automate_features.MAX_PAIRS,
+        },
+    }
+
+
+def _task(kind, order, params):
+    digest = hashlib.sha1(json.dumps([kind, params], sort_keys=True).encode()).hexdigest()[:16]
+    return {"task_id": f"{kind}-{digest}", "kind": kind, "order": order, "params": params}
+
+
+def expand_grid(spec):
+    """
+    One task per TAO point (spec["tao"]) and per feature subset (spec["features"]), for every filter set.
+    """
+    tasks = []
+    tao = spec.get("tao")
+    if tao:
+        grid = [[s, f] for s in tao["days"] for f in tao["days"]]
+        for filters in tao["filters"]:
+            for t_sus_days, t_fos_days in grid:
+                tasks.append(_task("tao", len(tasks), {
+                    "forum_id": tao["forum_id"], "seed": tao["seed"], "filters": filters,
+                    "t_sus_days": t_sus_days, "t_fos_days": t_fos_days, "max_pairs": tao["max_pairs"],
+                    "features": tao["features"], "sweep_grid": grid if tao.get("sweep") else None,
+                }))
+
+    features = spec.get("features")
+    if features:
+        for filters in features["filters"]:
+            for subset in automate_features.get_feature_subsets(features["features"]):
+                tasks.append(_task("features", len(tasks), {
+                    "forum_id": features["forum_id"], "seed": features["seed"], "filters": filters,
+                    "features": list(subset), "all_features": features["features"],
+                    "t_sus": features["t_sus"], "t_fos": features["t_fos"], "max_pairs": features["max_pairs"],
+                }))
+    return tasks
+
+
+def store_config(task):
+    """
+    The task's configuration as a ResultsStore config (TAO in seconds).
+    """
+    params = task["params"]
+    if task["kind"] == "tao":
+        t_sus, t_fos = params["t_sus_days"] * 24 * 3600, params["t_fos_days"] * 24 * 3600
+    else:
+        t_sus, t_fos = params["t_sus"], params["t_fos"]
+    return ResultsStore.config(params["forum_id"], params["filters"], t_sus, t_fos, params["features"],
+                               params["max_pairs"], params["seed"])
+
+
+def submit(queue, spec, store=None):
+    """
+    Queue the spec's tasks, skipping configurations already in the results store.
+    """
+    store = ResultsStore() if store is None else store
+    completed = store.done()
+    grid = expand_grid(spec)
+    tasks = [task for task in grid if ResultsStore.key(task["kind"], store_config(task)) not in completed]
+    added = sum(queue.put(task) for task in tasks)
+    print(f"Submitted {added} new tasks ({len(tasks) - added} already queued or finished, "
+          f"{len(grid) - len(tasks)} in the results store).")
+    return added
+
+
+# === Worker ===
+class Worker:
+    """
+    Claims tasks until the queue is empty. Forum loads, networks, TAO sweeps and feature samples
+    are kept in memory, so tasks sharing a filter set (or sample) reuse them. The worker's scratch
+    directory (sample CSVs and feature store) is removed when work() returns.
+    """
+
+    def __init__(self, queue, worker_id=None):
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.forums = {}
+        self.networks = {}
+        self.sweeps = {}
+        self.samples = {}
+        self.scratch_dir = os.path.join(queue.root, "workers", self.worker_id)
+        # The worker's own feature store, so workers computing the same keys never share files
+        self.feature_store = FeatureStore(os.path.join(self.scratch_dir, "feature_store"))
+
+    def network(self, forum_id, filters):
+        key = (forum_id, tuple(filters))
+        if key not in self.networks:
+            if forum_id not in self.forums:
+                self.forums[forum_id] = load_forums([forum_id])[forum_id]
+            flags, posts = self.forums[forum_id]
+            allowed_users, allowed_topics = apply_filters(forum_id=forum_id, active_filters=filters, flags=flags)
+            thread_info = build_thread_info(forum_id=forum_id, allowed_users=allowed_users,
+                                            allowed_topics=allowed_topics, posts=posts)
+            G = create_user_influence_network(thread_info) if thread_info else None
+            self.networks[key] = (thread_info, G)
+        return self.networks[key]
+
+    def run_tao(self, params, output_dir):
+        thread_info, G = self.network(params["forum_id"], params["filters"])
+        if not thread_info:
+            return {"f1_score": None, "avg_negatives_per_positive": None}
+
+        sweep = None
+        if params["sweep_grid"]:
+            key = (params["forum_id"], tuple(params["filters"]), params["max_pairs"], params["seed"],
+                   json.dumps(params["sweep_grid"]))
+            if key not in self.sweeps:
+                tao_grid = [(s * 24 * 3600, f * 24 * 3600) for s, f in params["sweep_grid"]]
+                self.sweeps[key] = ThresholdSweep(thread_info, G, tao_grid, max_pairs=params["max_pairs"],
+                                                  seed=params["seed"])
+            sweep = self.sweeps[key]
+
+        f1, avg_neg_per_pos = automate_tao.evaluate_tao_point(
+            thread_info, G, sweep, params["t_sus_days"], params["t_fos_days"], params["max_pairs"],
+            output_dir=output_dir, features=params["features"], seed=params["seed"])
+        return {"f1_score": f1, "avg_negatives_per_positive": avg_neg_per_pos}
+
+    def run_features(self, params, output_dir):
+        thread_info, G = self.network(params["forum_id"], params["filters"])
+        if not thread_info:
+            return {"f1_score": None}
+
+        # Sample and featurize once per (filters, TAO, budget); every subset task reuses it
+        key = json.dumps({k: v for k, v in params.items() if k != "features"}, sort_keys=True)
+        if key not in self.samples:
+            scratch = os.path.join(self.scratch_dir, hashlib.sha1(key.encode()).hexdigest()[:16])
+            balanced_sampling(
+                thread_info=thread_info, G=G, t_sus=params["t_sus"], t_fos=params["t_fos"],
+                max_pairs=params["max_pairs"], seed=params["seed"],
+                balanced_output=os.path.join(scratch, "balanced_samples.csv"),
+                imbalanced_output=os.path.join(scratch, "imbalanced_samples.csv"),
+                negatives_output=os.path.join(scratch, "negatives_per_positive.csv"),
+            )
+            matrices = {}
+            for name in ("balanced", "imbalanced"):
+                samples = pd.read_csv(os.path.join(scratch, f"{name}_samples.csv"))
+                store_key = FeatureStore.key(samples, G, thread_info, params["t_sus"], params["t_fos"],
+                                             filters=params["filters"])
+                matrices[name] = self.feature_store.features_for(store_key, samples, G, thread_info,
+                                                                 params["t_sus"], params["t_fos"],
+                                                                 params["all_features"])
+            svc = SubsetKernelSVC(matrices["balanced"], matrices["imbalanced"],
+                                  [f.lower() for f in params["all_features"]])
+            self.samples[key] = (matrices, svc)
+
+        matrices, svc = self.samples[key]
+        feature_cols = [f.lower() for f in params["features"]]
+        for name, matrix in matrices.items():
+            matrix[["user_id", "label"] + feature_cols].to_csv(
+                os.path.join(output_dir, f"features_on_{name}.csv"), index=False)
+        return {"f1_score": svc.f1(feature_cols)}
+
+    def run(self, task):
+        output_dir = self.queue.artifacts(task["task_id"])
+        print(f"\n→ [{self.worker_id}] {task['task_id']} {task['params']}")
+
+        # Renew the claim while the task runs
+        done = threading.Event()
+
+        def beat():
+            while not done.wait(HEARTBEAT_SECONDS):
+                self.queue.heartbeat(task["task_id"])
+
+        threading.Thread(target=beat, daemon=True).start()
+        started = time.time()
+        try:
+            runner = self.run_tao if task["kind"] == "tao" else self.run_features
+            result = runner(task["params"], output_dir)
+            result["seconds"] = round(time.time() - started, 2)
+            result["worker"] = self.worker_id
+            with open(os.path.join(output_dir, "result.json"), "w") as f:
+                json.dump(result, f, indent=1)
+            if result["f1_score"] is None:
+                # A failed model (or an empty network) is left for `retry`, not recorded as done
+                self.queue.fail(task, "No F1 score (model error or no threads after filtering; see worker log)")
+            else:
+                self.queue.complete(task, result)
+        except Exception:
+            print(f"[Task Error] {task['task_id']}")
+            traceback.print_exc()
+            self.queue.fail(task, traceback.format_exc())
+        finally:
+            done.set()
+
+    def work(self, wait=False):
+        completed = 0
+        try:
+            while True:
+                task = self.queue.claim(self.worker_id)
+                if task is None:
+                    if not wait:
+                        break
+                    time.sleep(POLL_SECONDS)
+                    continue
+                self.run(task)
+                completed += 1
+        finally:
+            # Results are in done/; the scratch files only served this worker's in-memory samples
+            self.samples.clear()
+            shutil.rmtree(self.scratch_dir, ignore_errors=True)
+        print(f"Worker {self.worker_id} finished {completed} tasks.")
+        return completed
+
+
+# === Merge ===
+def merge_results(queue, tao_csv=automate_tao.RESULTS_CSV, neg_stats_csv=automate_tao.NEG_STATS_CSV,
+                  features_csv=automate_features.RESULTS_CSV, store=None):
+    """
+    Record the finished tasks in the results store and write them into the
+    automate_tao / automate_features results CSVs (grid order).
+    """
+    store = ResultsStore() if store is None else store
+    done = sorted((r for r in queue.results() if r is not None), key=lambda r: r["order"])
+    for r in done:
+        if r["result"]["f1_score"] is None:
+            continue  # a failed model is not a completed configuration
+        store.record(r["kind"], store_config(r), r["result"]["f1_score"],
+                     r["result"].get("avg_negatives_per_positive"))
+    tao = [r for r in done if r["kind"] == "tao"]
+    features = [r for r in done if r["kind"] == "features"]
+
+    if tao:
+        os.makedirs(os.path.dirname(tao_csv), exist_ok=True)
+        pd.DataFrame([{
+            "filters": str(r["params"]["filters"]),
+            "t_sus": r["params"]["t_sus_days"],
+            "t_fos": r["params"]["t_fos_days"],
+            "f1_score": r["result"]["f1_score"],
+        } for r in tao]).to_csv(tao_csv, index=False)
+        pd.DataFrame([{
+            "filters": str(r["params"]["filters"]),
+            "t_sus": r["params"]["t_sus_days"],
+            "t_fos": r["params"]["t_fos_days"],
+            "avg_negatives_per_positive": r["result"]["avg_negatives_per_positive"],
+        } for r in tao]).to_csv(neg_stats_csv, index=False)
+        print(f"{len(tao)} TAO results saved to: {tao_csv} (negatives per positive: {neg_stats_csv})")
+
+    if features:
+        os.makedirs(os.path.dirname(features_csv), exist_ok=True)
+        pd.DataFrame([{
+            "filters": str(r["params"]["filters"]),
+            "features": "+".join(r["params"]["features"]),
+            "f1_score": r["result"]["f1_score"],
+        } for r in features]).to_csv(features_csv, index=False)
+        print(f"{len(features)} feature combination results saved to: {features_csv}")
+
+    counts = queue.status()
+    if counts["pending"] or counts["claimed"] or counts["failed"]:
+        print("Some tasks are not finished; the merged CSVs are partial.")
+    return len(done)
+
+
+if __name__ == "__main__":
+    # python experiment_runner.py submit [spec.yaml]  → queue the grid (default: automate_tao + automate_features)
+    # python experiment_runner.py worker [--wait]     → run tasks until the queue is empty (or forever with --wait)
+    # python experiment_runner.py status | merge | retry | clear
+    # Any command takes --config PATH for the feature settings (default config.yaml, see config.config_path).
+    # The queue directory is EXPERIMENTS.QUEUE_DIR in config.yaml (default experiment_queue)
+    args = sys.argv[1:]
+    if "--config" in args:
+        del args[args.index("--config"):args.index("--config") + 2]
+    command = args[0] if args else "status"
+    queue = DirectoryQueue()
+    if command == "submit":
+        if len(args) > 1:
+            with open(args[1]) as f:
+                spec = yaml.safe_load(f)
+        else:
+            spec = default_spec()
+        submit(queue, spec)
+    elif command == "worker":
+        Worker(queue).work(wait="--wait" in args[1:])
+    elif command == "merge":
+        merge_results(queue)
+    elif command == "retry":
+        queue.retry_failed()
+    elif command == "clear":
+        shutil.rmtree(queue.root, ignore_errors=True)
+        print(f"Removed queue {queue.root}.")
+    else:
+        queue.status()
@@ -0,0 +1,109 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+from collections import OrderedDict
+
+from indexes import to_seconds
+
+
+def graph_fingerprint(G, thread_info):
+    """
+    Cheap digest of the graph and thread data that IAN sets and features depend on.
+    """
+    num_posts, post_id_sum, max_time = 0, 0, 0
+    for posts in thread_info.values():
+        for post_id, _, post_time in posts:
+            num_posts += 1
+            post_id_sum += int(post_id)
+            max_time = max(max_time, to_seconds(post_time))
+
+    parts = (G.number_of_nodes(), G.number_of_edges(), G.is_multigraph(), G.graph.get('pruned_edges'),
+             len(thread_info), num_posts, post_id_sum, max_time)
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:16]
+
+
+def _normalize(part):
+    # timestamps and numpy scalars → plain ints so keys are stable across runs
+    if hasattr(part, 'value') and hasattr(part, 'tz'):
+        return to_seconds(part)
+    if hasattr(part, 'item'):
+        return part.item()
+    return part
+
+
+class FeatureCache:
+    """
+    Bounded LRU cache of IAN sets and per-row features, with an optional SQLite tier on disk
+    so reruns can skip rows that were already computed.
+    Keys are tuples such as ('all_ian', v, t_v, t_sus, t_fos, fingerprint).
+    """
+
+    def __init__(self, maxsize=100000, path=None):
+        self.maxsize = maxsize
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.db = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self.db = sqlite3.connect(path)
+            self.db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB)")
+
+    @staticmethod
+    def make_key(*parts):
+        return tuple(_normalize(p) for p in parts)
+
+    def get(self, key):
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return self.memory[key]
+
+        if self.db is not None:
+            row = self.db.execute("SELECT value FROM cache WHERE key = ?", (repr(key),)).fetchone()
+            if row is not None:
+                self.disk_hits += 1
+                value = pickle.loads(row[0])
+                self._remember(key, value)
+                return value
+
+        self.misses += 1
+        return None
+
+    def put(self, key, value, persist=True):
+        self._remember(key, value)
+        if persist and self.db is not None:
+            self.db.execute("INSERT OR REPLACE INTO cache VALUES (?, ?)", (repr(key), pickle.dumps(value)))
+
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.maxsize:
+            self.memory.popitem(last=False)
+
+    def flush(self):
+        if self.db is not None:
+            self.db.commit()
+
+    def close(self):
+        if self.db is not None:
+            self.db.commit()
+            self.db.close()
+            self.db = None
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "entries": len(self.memory),
+        }
+
+    def report(self):
+        s = self.stats()
+        print(f"Feature cache: {s['memory_hits']} memory hits, {s['disk_hits']} disk hits, "
+              f"{s['misses']} misses (hit rate {s['hit_rate']:.1%}, {s['entries']} entries in memory)")
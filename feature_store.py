@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from feature_cache import graph_fingerprint
+from features import compute_features_for_pairs
+
+# Sample columns that identify the rows of a feature matrix
+SAMPLE_COLUMNS = ["user_id", "thread_id", "timestamp", "label", "v1_user_id"]
+
+
+class FeatureStore:
+    """
+    Compute-once feature matrices, one per (filters, TAO, sample) key.
+
+    Each matrix is a directory with one .npy file per column (user_id, label and one per feature)
+    and a meta.json listing the stored columns. Asking for features that are not stored yet
+    computes only those columns and appends them; everything else is read back (memory-mapped).
+    """
+
+    def __init__(self, directory="outputs/feature_store"):
+        self.directory = directory
+
+    @staticmethod
+    def key(df, G, thread_info, t_sus, t_fos, hub_percentile=0.1, filters=None):
+        """
+        Key of the sampled rows in df under one graph, TAO window and hub percentile.
+        """
+        sample = pd.util.hash_pandas_object(df[SAMPLE_COLUMNS].astype(str), index=False).to_numpy()
+        parts = (str(filters), t_sus, t_fos, hub_percentile, graph_fingerprint(G, thread_info),
+                 hashlib.sha1(sample.tobytes()).hexdigest())
+        return hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def meta(self, key):
+        try:
+            with open(os.path.join(self.path(key), "meta.json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def columns(self, key):
+        meta = self.meta(key)
+        return meta["columns"] if meta else []
+
+    def load(self, key, columns=None, mmap=True):
+        columns = self.columns(key) if columns is None else columns
+        return pd.DataFrame({name: np.asarray(np.load(os.path.join(self.path(key), f"{name}.npy"),
+                                                      mmap_mode="r" if mmap else None))
+                             for name in columns}, copy=False)
+
+    def append(self, key, frame):
+        """
+        Add frame's columns that are not stored yet; rows must line up with the stored matrix.
+        """
+        meta = self.meta(key) or {"columns": [], "rows": len(frame)}
+        if len(frame) != meta["rows"]:
+            raise ValueError(f"Feature matrix {key} has {meta['rows']} rows, got {len(frame)}.")
+
+        # Every file is written under a unique name and swapped in, so readers (which may have it
+        # memory-mapped) never see a truncated file and concurrent writers never share a tmp file
+        os.makedirs(self.path(key), exist_ok=True)
+        suffix = f".tmp{os.getpid()}-{threading.get_ident()}"
+        for name in frame.columns:
+            if name not in meta["columns"]:
+                path = os.path.join(self.path(key), f"{name}.npy")
+                with open(path + suffix, "wb") as f:
+                    np.save(f, frame[name].to_numpy())
+                os.replace(path + suffix, path)
+                meta["columns"].append(name)
+
+        # meta.json is replaced last, so a column only counts as stored once fully written
+        tmp = os.path.join(self.path(key), "meta.json" + suffix)
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(self.path(key), "meta.json"))
+
+    def features_for(self, key, df, G, thread_info, t_sus, t_fos, features, hub_percentile=0.1,
+                     cache=None, workers=1, output_path=None):
+        """
+        user_id, label and the requested feature columns for the rows of df, computing
+        (and storing) only the features missing from the matrix under key.
+        """
+        if df.empty:
+            return compute_features_for_pairs(df, G, thread_info, t_sus, t_fos, hub_percentile,
+                                              output_path=output_path, features=features)
+
+        stored = self.columns(key)
+        missing = [name for name in features if name.lower() not in stored]
+        if missing:
+            print(f"Feature store {key}: computing {', '.join(missing)} "
+                  f"({max(len(stored) - 2, 0)} feature columns stored).")
+            computed = compute_features_for_pairs(df, G, thread_info, t_sus, t_fos, hub_percentile,
+                                                  output_path=None, cache=cache, workers=workers,
+                                                  features=missing)
+            self.append(key, computed)
+        else:
+            print(f"Feature store {key}: all of {', '.join(features)} already stored.")
+
+        out = self.load(key, ["user_id", "label"] + [name.lower() for name in features])
+        if output_path:
+            out.to_csv(output_path, index=False)
+        return out
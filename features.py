@@ -1,81 +1,62 @@
 from itertools import combinations
+import multiprocessing
+import os
+import time
 import networkx as nx
+import numpy as np
 import pandas as pd
+from scipy import sparse
 from collections import defaultdict
 import config
+from indexes import build_forum_index, to_seconds
+from feature_cache import FeatureCache, graph_fingerprint
 
 cfg = config.get_config_all(config)
 
 
-def get_influential_active_neighbors(v, thread_id, t_v, thread_info, t_sus, t_fos):
+def get_influential_active_neighbors(v, thread_id, t_v, thread_info, t_sus, t_fos, index=None):
     """
     Returns IANs of user v in thread θ (before t_v), satisfying:
     - forgettability (within t_fos)
     - activity (v posted after v1 in another thread within t_sus)
     """
+    if index is None:
+        index = build_forum_index(thread_info)
+
+    t_v = to_seconds(t_v)
     potential_v1s = set()
 
     for post_id_v1, v1, t_v1_in_thread in thread_info[thread_id]:
-        if v1 == v or pd.to_datetime(t_v1_in_thread) >= pd.to_datetime(t_v):
+        if v1 == v or v1 in potential_v1s:
             continue
 
-        freshness = (pd.to_datetime(t_v) - pd.to_datetime(t_v1_in_thread)).total_seconds()
-        if freshness > t_fos:
+        t_v1_in_thread = to_seconds(t_v1_in_thread)
+        if t_v1_in_thread >= t_v or t_v - t_v1_in_thread > t_fos:
             continue
 
-        for other_thread, posts in thread_info.items():
-            if other_thread == thread_id:
-                continue
-
-            v1_post_times = [t for _, u, t in posts if u == v1]
-            v_post_times = [t for _, u, t in posts if u == v]
-
-            for t_v_other in v_post_times:
-                for t_v1_other in v1_post_times:
-                    delta = (pd.to_datetime(t_v1_in_thread) - pd.to_datetime(t_v_other)).total_seconds()
-                    if pd.to_datetime(t_v1_other) < pd.to_datetime(t_v_other) and delta <= t_sus:
-                        potential_v1s.add(v1)
-                        break
-                if v1 in potential_v1s:
-                    break
+        if index.posted_after(v1, v, t_v1_in_thread - t_sus, exclude_thread=thread_id):
+            potential_v1s.add(v1)
 
     return potential_v1s
 
 
-def get_all_influential_active_neighbors(v, t_v, thread_info, t_sus, t_fos):
+def get_all_influential_active_neighbors(v, t_v, thread_info, t_sus, t_fos, index=None):
     """
     Returns IANs of user v across all threads (including current thread), before t_v.
     Same as get_influential_active_neighbors but global across all threads.
     """
-    t_v = pd.to_datetime(t_v)
-    all_v1s = set()
-
-    for thread_id, posts in thread_info.items():
-        for post_id_v1, v1, t_v1_in_thread in posts:
-            t_v1_in_thread = pd.to_datetime(t_v1_in_thread)
-
-            if v1 == v or t_v1_in_thread >= t_v:
-                continue
+    if index is None:
+        index = build_forum_index(thread_info)
 
-            freshness = (t_v - t_v1_in_thread).total_seconds()
-            if freshness > t_fos:
-                continue
-
-            for other_thread, other_posts in thread_info.items():
-                if other_thread == thread_id:
-                    continue
-
-                v1_post_times = [pd.to_datetime(t) for _, u, t in other_posts if u == v1]
-                v_post_times = [pd.to_datetime(t) for _, u, t in other_posts if u == v]
+    t_v = to_seconds(t_v)
+    all_v1s = set()
 
-                for t_v_other in v_post_times:
-                    for t_v1_other in v1_post_times:
-                        delta = (t_v1_in_thread - t_v_other).total_seconds()
-                        if t_v1_other < t_v_other and delta <= t_sus:
-                            all_v1s.add(v1)
-                            break
-                    if v1 in all_v1s:
-                        break
+    # Only users that ever posted before v in a shared thread can pass the activity check
+    for v1 in index.precedence.get(v, {}):
+        for t_v1_in_thread, thread_id in index.posts_between(v1, t_v - t_fos, t_v):
+            if index.posted_after(v1, v, t_v1_in_thread - t_sus, exclude_thread=thread_id):
+                all_v1s.add(v1)
+                break
 
     return all_v1s
 
@@ -100,18 +81,60 @@ def has_edge_before_t_v(G, u, z, t_v):
     """
     True if there exists an edge u→z or z→u before t_v
     """
-    if G.has_edge(u, z):
-        for data in G.get_edge_data(u, z).values():
-            if 'date' in data and pd.to_datetime(data['date']) <= t_v:
-                return True
-    if G.has_edge(z, u):
-        for data in G.get_edge_data(z, u).values():
-            if 'date' in data and pd.to_datetime(data['date']) <= t_v:
-                return True
+    t_v = to_seconds(t_v)
+    for a, b in ((u, z), (z, u)):
+        if not G.has_edge(a, b):
+            continue
+        if G.is_multigraph():
+            for data in G.get_edge_data(a, b).values():
+                if 'date' in data and to_seconds(data['date']) <= t_v:
+                    return True
+        elif to_seconds(G.edges[a, b]['first_date']) <= t_v:
+            return True
     return False
 
 
-def calculate_open_triads(G, all_ian_set, t_v):
+class EdgeTimeMatrix:
+    """
+    Symmetric scipy.sparse matrix of the earliest edge time between each user pair, in either
+    direction. Times are stored as seconds since the earliest edge + 1 so every edge is non-zero.
+    """
+
+    def __init__(self, G):
+        earliest = {}
+        if G.is_multigraph():
+            edge_times = ((u, z, data['date']) for u, z, data in G.edges(data=True) if 'date' in data)
+        else:
+            edge_times = G.edges(data='first_date')
+        for u, z, date in edge_times:
+            key = (u, z) if (u, z) in earliest or (z, u) not in earliest else (z, u)
+            t = to_seconds(date)
+            if key not in earliest or t < earliest[key]:
+                earliest[key] = t
+
+        self.position = {u: i for i, u in enumerate(G.nodes())}
+        self.base = min(earliest.values()) if earliest else 0
+
+        rows = np.array([self.position[u] for u, _ in earliest], dtype=np.int64)
+        cols = np.array([self.position[z] for _, z in earliest], dtype=np.int64)
+        vals = np.array([t - self.base + 1 for t in earliest.values()], dtype=np.float64)
+        n = len(self.position)
+        self.matrix = sparse.coo_matrix(
+            (np.r_[vals, vals], (np.r_[rows, cols], np.r_[cols, rows])), shape=(n, n)
+        ).tocsr()
+
+    def count_connected_pairs(self, nodes, t_v):
+        """
+        Number of unordered pairs among nodes with an edge (either direction) at or before t_v.
+        """
+        idx = [self.position[u] for u in nodes if u in self.position]
+        if len(idx) < 2:
+            return 0
+        sub = self.matrix[idx][:, idx]
+        return int(np.count_nonzero(sub.data <= to_seconds(t_v) - self.base + 1)) // 2
+
+
+def calculate_open_triads(G, all_ian_set, t_v, edge_times=None):
     """
     OPT = # of unordered IAN pairs (u, z) where u↔z edge exists before t_v
     """
@@ -119,6 +142,9 @@ def calculate_open_triads(G, all_ian_set, t_v):
     if len(infl_nodes) < 2:
         return 0
 
+    if edge_times is not None:
+        return edge_times.count_connected_pairs(infl_nodes, t_v)
+
     opt_count = 0
     for u, z in combinations(infl_nodes, 2):
         if has_edge_before_t_v(G, u, z, t_v):
@@ -126,17 +152,23 @@ def calculate_open_triads(G, all_ian_set, t_v):
     return opt_count
 
 
-def get_total_possible_triads_for_v(G, v, t_v, thread_info, t_sus, t_fos):
+def get_total_possible_triads_for_v(G, v, t_v, thread_info, t_sus, t_fos, index=None, edge_times=None,
+                                    infl_set=None):
     """
     Counts how many unordered pairs (u, z) of IANs of v are connected before t_v
     – i.e., total possible triads v could be part of.
+    infl_set can pass in the already computed all-thread IANs of v.
     """
-    infl_set = get_all_influential_active_neighbors(v, t_v, thread_info, t_sus, t_fos)
+    if infl_set is None:
+        infl_set = get_all_influential_active_neighbors(v, t_v, thread_info, t_sus, t_fos, index=index)
     infl_nodes = [u for u in infl_set if u != v]
 
     if len(infl_nodes) < 2:
         return 0
 
+    if edge_times is not None:
+        return edge_times.count_connected_pairs(infl_nodes, t_v)
+
     triangle_count = 0
     for u, z in combinations(infl_nodes, 2):
         if has_edge_before_t_v(G, u, z, t_v):
@@ -155,63 +187,185 @@ def calculate_clustering_coefficient(open_triads, total_possible_triads):
     return open_triads / total_possible_triads
 
 
-def compute_features_for_pairs(df, G, thread_info, t_sus, t_fos, hub_percentile=0.1,
-                               output_path="outputs/training_set.csv"):
+class _FeatureContext:
     """
-    Main function to compute NAN, PNE, HUB, OPT, CLC
-    for each (v, v') pair in the dataframe.
+    Everything the per-row computation reads, built once per compute_features_for_pairs call.
+    Forked workers inherit it copy-on-write instead of receiving it per task.
     """
-    features = []
 
-    # --- Compute global hub set ---
-    out_degrees = {u: G.out_degree(u) for u in G.nodes()}
-    sorted_users = sorted(out_degrees.items(), key=lambda x: x[1], reverse=True)
-    cutoff = int(len(sorted_users) * hub_percentile)
-    hub_set = set([u for u, _ in sorted_users[:cutoff]])
+    def __init__(self, G, thread_info, t_sus, t_fos, hub_percentile, enabled):
+        self.G = G
+        self.thread_info = thread_info
+        self.t_sus = t_sus
+        self.t_fos = t_fos
+        self.enabled = enabled
+
+        # --- Build time/precedence lookups once for all rows ---
+        self.index = build_forum_index(thread_info)
+
+        # --- Compute global hub set ---
+        out_degrees = {u: G.out_degree(u, weight='count') for u in G.nodes()}
+        sorted_users = sorted(out_degrees.items(), key=lambda x: x[1], reverse=True)
+        cutoff = int(len(sorted_users) * hub_percentile)
+        self.hub_set = set([u for u, _ in sorted_users[:cutoff]])
+
+        # --- Earliest interaction time per user pair, for OPT/CLC ---
+        self.edge_times = None
+        if 'OPT' in enabled or 'CLC' in enabled:
+            self.edge_times = EdgeTimeMatrix(G)
 
-    for _, row in df.iterrows():
-        v = row['user_id']
-        thread_id = row['thread_id']
-        t_v = pd.to_datetime(row['timestamp'])
-        label = row['label']
-        v1_user_id = row['v1_user_id']
 
-        f = {'user_id': v, 'label': label}
+_worker_context = None
 
-        # Precompute IANs in thread and across all threads
-        infl_set = get_influential_active_neighbors(v, thread_id, t_v, thread_info, t_sus, t_fos)
-        all_ian_set = get_all_influential_active_neighbors(v, t_v, thread_info, t_sus, t_fos)
 
-        if label == 0:
-            infl_set.add(v1_user_id)
-            all_ian_set.add(v1_user_id)
+def _uncached(key, compute):
+    return compute()
 
-        # NAN
-        if cfg['FEATURE'].get('NAN', 'False') == "True":
-            f['nan'] = len(infl_set)
 
-        # PNE
-        if cfg['FEATURE'].get('PNE', 'False') == "True":
-            f['pne'] = calculate_pne(infl_set, all_ian_set)
+def _row_features(ctx, v, thread_id, t_v, label, v1_user_id, cached=_uncached, fingerprint=None):
+    G, thread_info, index = ctx.G, ctx.thread_info, ctx.index
+    t_sus, t_fos, enabled = ctx.t_sus, ctx.t_fos, ctx.enabled
 
-        # HUB
-        if cfg['FEATURE'].get('HUB', 'False') == "True":
-            f['hub'] = calculate_hub_score(infl_set, hub_set)
+    f = {'user_id': v, 'label': label}
 
-        # OPT and CLC
-        if cfg['FEATURE'].get('OPT', 'False') == "True" or cfg['FEATURE'].get('CLC', 'False') == "True":
-            opt_count = calculate_open_triads(G, all_ian_set, t_v)
+    # Precompute IANs in thread and across all threads
+    infl_set = set(cached(
+        FeatureCache.make_key('ian', v, thread_id, t_v, t_sus, t_fos, fingerprint),
+        lambda: frozenset(get_influential_active_neighbors(v, thread_id, t_v, thread_info,
+                                                           t_sus, t_fos, index=index))))
+    all_ian_base = cached(
+        FeatureCache.make_key('all_ian', v, t_v, t_sus, t_fos, fingerprint),
+        lambda: frozenset(get_all_influential_active_neighbors(v, t_v, thread_info,
+                                                               t_sus, t_fos, index=index)))
+    all_ian_set = set(all_ian_base)
 
-            if cfg['FEATURE'].get('OPT', 'False') == "True":
-                f['opt'] = opt_count
+    if label == 0:
+        infl_set.add(v1_user_id)
+        all_ian_set.add(v1_user_id)
 
-            if cfg['FEATURE'].get('CLC', 'False') == "True":
-                total_triads = get_total_possible_triads_for_v(G, v, t_v, thread_info, t_sus, t_fos)
-                f['clc'] = calculate_clustering_coefficient(opt_count, total_triads)
+    # NAN
+    if 'NAN' in enabled:
+        f['nan'] = len(infl_set)
 
-        features.append(f)
+    # PNE
+    if 'PNE' in enabled:
+        f['pne'] = calculate_pne(infl_set, all_ian_set)
 
-    out_df = pd.DataFrame(features)
-    out_df.to_csv(output_path, index=False)
-    print(f"Feature dataset written to {output_path}")
+    # HUB
+    if 'HUB' in enabled:
+        f['hub'] = calculate_hub_score(infl_set, ctx.hub_set)
+
+    # OPT and CLC
+    if 'OPT' in enabled or 'CLC' in enabled:
+        opt_count = calculate_open_triads(G, all_ian_set, t_v, edge_times=ctx.edge_times)
+
+        if 'OPT' in enabled:
+            f['opt'] = opt_count
+
+        if 'CLC' in enabled:
+            total_triads = get_total_possible_triads_for_v(G, v, t_v, thread_info, t_sus, t_fos,
+                                                          index=index, edge_times=ctx.edge_times,
+                                                          infl_set=all_ian_base)
+            f['clc'] = calculate_clustering_coefficient(opt_count, total_triads)
+
+    return f
+
+
+def _compute_shard(task):
+    shard_id, rows = task
+    start = time.perf_counter()
+    out = [_row_features(_worker_context, *row) for row in rows]
+    return shard_id, out, os.getpid(), len(rows), time.perf_counter() - start
+
+
+def _compute_parallel(ctx, rows, workers):
+    """
+    Split rows into contiguous shards, run them on a fork-based pool and reassemble in order.
+    """
+    global _worker_context
+
+    shard_size = max(1, -(-len(rows) // (workers * 4)))
+    tasks = [(i, rows[start:start + shard_size]) for i, start in enumerate(range(0, len(rows), shard_size))]
+
+    _worker_context = ctx
+    try:
+        with multiprocessing.get_context("fork").Pool(workers) as pool:
+            shards = list(pool.imap_unordered(_compute_shard, tasks))
+    finally:
+        _worker_context = None
+
+    per_worker = defaultdict(lambda: [0, 0.0])
+    for _, _, pid, n_rows, elapsed in shards:
+        per_worker[pid][0] += n_rows
+        per_worker[pid][1] += elapsed
+    for pid, (n_rows, elapsed) in sorted(per_worker.items()):
+        print(f"Worker {pid}: {n_rows} rows in {elapsed:.1f}s ({n_rows / max(elapsed, 1e-9):.1f} rows/s)")
+
+    shards.sort(key=lambda x: x[0])
+    return [f for _, out, _, _, _ in shards for f in out]
+
+
+def compute_features_for_pairs(df, G, thread_info, t_sus, t_fos, hub_percentile=0.1,
+                               output_path="outputs/training_set.csv", cache=None, workers=1, features=None):
+    """
+    Main function to compute NAN, PNE, HUB, OPT, CLC
+    for each (v, v') pair in the dataframe.
+    features limits the computed features (default: those enabled under FEATURE in config.yaml).
+    An optional FeatureCache memoizes IAN sets and finished rows across calls and runs.
+    workers > 1 computes rows on a process pool (fork start method); output is identical to the serial path.
+    output_path=None skips writing the CSV.
+    """
+    if features is None:
+        enabled = tuple(name for name in ['NAN', 'PNE', 'HUB', 'OPT', 'CLC']
+                        if cfg['FEATURE'].get(name, 'False') == "True")
+    else:
+        enabled = tuple(name for name in ['NAN', 'PNE', 'HUB', 'OPT', 'CLC'] if name in features)
+    ctx = _FeatureContext(G, thread_info, t_sus, t_fos, hub_percentile, enabled)
+    fingerprint = graph_fingerprint(G, thread_info) if cache is not None else None
+
+    def cached(key, compute):
+        value = cache.get(key)
+        if value is None:
+            value = compute()
+            cache.put(key, value, persist=False)  # only finished rows go to the disk tier
+        return value
+
+    rows = [(row['user_id'], row['thread_id'], pd.to_datetime(row['timestamp']), row['label'], row['v1_user_id'])
+            for _, row in df.iterrows()]
+    feature_rows = [None] * len(rows)
+
+    # Finished rows from the cache; only the rest are computed
+    row_keys = [None] * len(rows)
+    if cache is not None:
+        for i, (v, thread_id, t_v, label, v1_user_id) in enumerate(rows):
+            row_keys[i] = FeatureCache.make_key('row', v, thread_id, t_v, label, v1_user_id,
+                                                t_sus, t_fos, hub_percentile, enabled, fingerprint)
+            f = cache.get(row_keys[i])
+            if f is not None:
+                feature_rows[i] = dict(f)
+    pending = [i for i, f in enumerate(feature_rows) if f is None]
+
+    can_fork = "fork" in multiprocessing.get_all_start_methods()
+    if workers > 1 and len(pending) > 1 and can_fork:
+        computed = _compute_parallel(ctx, [rows[i] for i in pending], workers)
+    else:
+        if workers > 1 and len(pending) > 1:
+            print("Process pool needs the fork start method; computing features serially.")
+        computed = [_row_features(ctx, *rows[i], cached=cached if cache is not None else _uncached,
+                                  fingerprint=fingerprint)
+                    for i in pending]
+
+    for i, f in zip(pending, computed):
+        feature_rows[i] = f
+        if cache is not None:
+            cache.put(row_keys[i], dict(f))
+
+    if cache is not None:
+        cache.flush()
+        cache.report()
+
+    out_df = pd.DataFrame(feature_rows)
+    if output_path:
+        out_df.to_csv(output_path, index=False)
+        print(f"Feature dataset written to {output_path}")
     return out_df
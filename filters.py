@@ -1,56 +1,208 @@
-from connect import get_q
+from connect import get_q, config
+import pandas as pd
 
-filters_sql = {
-    0: """ -- posts_per_user
-        SELECT p.user_id
-        FROM posts p JOIN topics t ON p.topic_id = t.topic_id
-        WHERE t.forum_id = %s 
-          AND LENGTH(content_post) > 10 AND classification_topic >= 0.5
-        GROUP BY p.user_id
-        HAVING COUNT(p.post_id) > 2;
-    """,
-    1: """ -- unique_thread_participation_per_user
-        SELECT p.user_id
-        FROM posts p JOIN topics t ON p.topic_id = t.topic_id
-        WHERE t.forum_id = %s
-          AND LENGTH(content_post) > 10 AND classification_topic >= 0.5
-        GROUP BY p.user_id
-        HAVING COUNT(DISTINCT p.topic_id) > 2;
-    """,
-    2: """ -- posts_per_thread
-        SELECT t.topic_id
-        FROM topics t JOIN posts p ON t.topic_id = p.topic_id
-        WHERE t.forum_id = %s
-          AND LENGTH(content_post) > 10 AND classification_topic >= 0.5
-        GROUP BY t.topic_id
-        HAVING COUNT(p.post_id) > 2 AND COUNT(DISTINCT p.user_id) > 1;
-    """,
-    3: """ -- unique_users_per_thread
-        SELECT t.topic_id
-        FROM topics t JOIN posts p ON t.topic_id = p.topic_id
-        WHERE t.forum_id = %s
-          AND LENGTH(content_post) > 10 AND classification_topic >= 0.5
-        GROUP BY t.topic_id
-        HAVING COUNT(DISTINCT p.user_id) > 2;
-    """,
+# Column of the filter flags frame holding each filter's pass/fail flag
+FILTER_COLUMNS = {
+    0: "posts_per_user",
+    1: "threads_per_user",
+    2: "posts_per_thread",
+    3: "users_per_thread",
 }
 
 # Filters are grouped by return type:
 # Filters [0, 1] return user_ids, Filters [2, 3] return topic_ids.
-# We separate them to apply intersections correctly by ID type.
-def apply_filters(forum_id, active_filters):
+TOPIC_FILTERS = [2, 3]
+
+# Default scope: whole forum history and the original thresholds ("more than N")
+DEFAULT_SCOPE = {
+    "begin": None,          # DATE.BEGIN, inclusive
+    "end": None,            # DATE.END, exclusive
+    "user_posts": 2,        # NETWORK.USER_POSTS_THRESHOLD   (filter 0)
+    "user_threads": 2,      # NETWORK.USER_THREADS_THRESHOLD (filter 1)
+    "thread_posts": 2,      # NETWORK.THREAD_POSTS_THRESHOLD (filter 2)
+    "thread_users": 2,      # NETWORK.THREAD_USERS_THRESHOLD (filter 3)
+}
+
+# SQL condition of each filter over user_stats / topic_stats
+FILTER_CONDITIONS = {
+    0: "num_posts > %(user_posts)s",
+    1: "num_threads > %(user_threads)s",
+    2: "num_posts > %(thread_posts)s AND num_users > 1",
+    3: "num_users > %(thread_users)s",
+}
+
+# The forum's posts in the date window (fp), scanned and joined once,
+# then aggregated once per user and once per topic
+POST_STATS_CTE = """
+    WITH fp AS (
+        SELECT p.post_id, p.topic_id, p.user_id, p.dateadded_post
+        FROM posts p JOIN topics t ON p.topic_id = t.topic_id
+        WHERE t.forum_id = %(forum_id)s
+          AND LENGTH(content_post) > 10 AND classification_topic >= 0.5
+          AND (%(begin)s IS NULL OR p.dateadded_post >= %(begin)s)
+          AND (%(end)s IS NULL OR p.dateadded_post < %(end)s)
+    ),
+    user_stats AS (
+        SELECT user_id, COUNT(post_id) AS num_posts, COUNT(DISTINCT topic_id) AS num_threads
+        FROM fp
+        GROUP BY user_id
+    ),
+    topic_stats AS (
+        SELECT topic_id, COUNT(post_id) AS num_posts, COUNT(DISTINCT user_id) AS num_users
+        FROM fp
+        GROUP BY topic_id
+    )
+"""
+
+# All four filters in one pass.
+# Returns one row per user/topic passing at least one filter, with a flag column per filter.
+FILTER_FLAGS_QUERY = POST_STATS_CTE + f"""
+    , flags AS (
+        SELECT 'user' AS kind, user_id AS id,
+               {FILTER_CONDITIONS[0]} AS posts_per_user,
+               {FILTER_CONDITIONS[1]} AS threads_per_user,
+               NULL::boolean AS posts_per_thread,
+               NULL::boolean AS users_per_thread
+        FROM user_stats
+        UNION ALL
+        SELECT 'topic', topic_id,
+               NULL, NULL,
+               {FILTER_CONDITIONS[2]},
+               {FILTER_CONDITIONS[3]}
+        FROM topic_stats
+    )
+    SELECT *
+    FROM flags
+    WHERE posts_per_user OR threads_per_user OR posts_per_thread OR users_per_thread;
+"""
+
+
+def normalize_scope(scope):
+    """
+    Scope with integer thresholds and BEGIN/END as datetimes (or None), whether they came from
+    YAML as strings ("4", "2000-6-1"), dates or numbers, so SQL and in-memory filtering agree.
+    """
+    def to_datetime(value):
+        return None if value is None or value == "" else pd.Timestamp(value).to_pydatetime()
+
+    return {
+        "begin": to_datetime(scope["begin"]),
+        "end": to_datetime(scope["end"]),
+        "user_posts": int(scope["user_posts"]),
+        "user_threads": int(scope["user_threads"]),
+        "thread_posts": int(scope["thread_posts"]),
+        "thread_users": int(scope["thread_users"]),
+    }
+
+
+def network_scope(cfg=None):
+    """
+    Date window and filter thresholds from config.yaml (DATE.BEGIN/END, NETWORK.*_THRESHOLD),
+    falling back to DEFAULT_SCOPE for anything not set.
+    """
+    cfg = config if cfg is None else cfg
+    date = cfg.get("DATE") or {}
+    network = cfg.get("NETWORK") or {}
+    return normalize_scope({
+        "begin": date.get("BEGIN", DEFAULT_SCOPE["begin"]),
+        "end": date.get("END", DEFAULT_SCOPE["end"]),
+        "user_posts": network.get("USER_POSTS_THRESHOLD", DEFAULT_SCOPE["user_posts"]),
+        "user_threads": network.get("USER_THREADS_THRESHOLD", DEFAULT_SCOPE["user_threads"]),
+        "thread_posts": network.get("THREAD_POSTS_THRESHOLD", DEFAULT_SCOPE["thread_posts"]),
+        "thread_users": network.get("THREAD_USERS_THRESHOLD", DEFAULT_SCOPE["thread_users"]),
+    })
+
+
+def scope_params(forum_id, scope=None):
+    """
+    Named query parameters for forum_id and a scope (default: network_scope()).
+    """
+    return {"forum_id": forum_id, **(network_scope() if scope is None else normalize_scope(scope))}
+
+
+def filtered_posts_query(active_filters):
+    """
+    Posts of the forum's date window restricted to the users/topics passing the active filters,
+    evaluated entirely in the database (same rules as apply_filters: a filter passing nobody is ignored).
+    Takes scope_params(...) as parameters.
+    """
+    clauses = []
+    for idx in active_filters:
+        table, column = ("topic_stats", "topic_id") if idx in TOPIC_FILTERS else ("user_stats", "user_id")
+        condition = FILTER_CONDITIONS[idx]
+        clauses.append(f"AND (fp.{column} IN (SELECT {column} FROM {table} WHERE {condition})\n"
+                       f"           OR NOT EXISTS (SELECT 1 FROM {table} WHERE {condition}))")
+
+    return POST_STATS_CTE + """
+    SELECT fp.post_id, fp.topic_id, fp.user_id, fp.dateadded_post
+    FROM fp
+    WHERE TRUE
+      {clauses}
+    ORDER BY fp.topic_id, fp.dateadded_post;
+""".format(clauses="\n      ".join(clauses))
+
+
+def filter_flags_from_posts(posts, scope=None):
+    """
+    Same flags as FILTER_FLAGS_QUERY, derived from an already-loaded post frame
+    (post_id, topic_id, user_id, dateadded_post columns, e.g. build_network.load_posts)
+    without querying again.
+    """
+    scope = network_scope() if scope is None else normalize_scope(scope)
+    if scope["begin"] is not None:
+        posts = posts[posts["dateadded_post"] >= scope["begin"]]
+    if scope["end"] is not None:
+        posts = posts[posts["dateadded_post"] < scope["end"]]
+
+    user_stats = posts.groupby("user_id").agg(num_posts=("post_id", "count"), num_threads=("topic_id", "nunique"))
+    topic_stats = posts.groupby("topic_id").agg(num_posts=("post_id", "count"), num_users=("user_id", "nunique"))
+
+    users = pd.DataFrame({
+        "kind": "user",
+        "id": user_stats.index,
+        "posts_per_user": (user_stats["num_posts"] > scope["user_posts"]).to_numpy(),
+        "threads_per_user": (user_stats["num_threads"] > scope["user_threads"]).to_numpy(),
+    })
+    topics = pd.DataFrame({
+        "kind": "topic",
+        "id": topic_stats.index,
+        "posts_per_thread": ((topic_stats["num_posts"] > scope["thread_posts"])
+                             & (topic_stats["num_users"] > 1)).to_numpy(),
+        "users_per_thread": (topic_stats["num_users"] > scope["thread_users"]).to_numpy(),
+    })
+    return pd.concat([users, topics], ignore_index=True)
+
+
+def load_filter_flags(forum_id, scope=None):
+    return get_q(FILTER_FLAGS_QUERY, params=scope_params(forum_id, scope))
+
+
+def apply_filters(forum_id, active_filters, posts=None, scope=None, flags=None):
+    """
+    Allowed (user_ids, topic_ids) for the active filters; None where no filter of that type applies.
+    Evaluates every filter with a single query, or in memory when the forum's post frame is given,
+    or from flags already fetched with load_filter_flags (e.g. concurrently with the post load).
+    Thresholds and the date window come from scope (default: network_scope(), i.e. config.yaml).
+    A filter that passes nobody is ignored.
+    """
+    if flags is None:
+        flags = filter_flags_from_posts(posts, scope) if posts is not None else load_filter_flags(forum_id, scope)
+    if flags is None:
+        return None, None
+
     user_filters = []
     topic_filters = []
 
     for idx in active_filters:
-        df = get_q(filters_sql[idx], params=(forum_id,))
-        if df is None or df.empty:
+        kind = "topic" if idx in TOPIC_FILTERS else "user"
+        passed = flags[(flags["kind"] == kind) & flags[FILTER_COLUMNS[idx]].eq(True)]
+        if passed.empty:
             continue
 
-        if idx in [2, 3]:
-            topic_filters.append(set(df.iloc[:, 0].tolist()))
+        if kind == "topic":
+            topic_filters.append(set(passed["id"].tolist()))
         else:
-            user_filters.append(set(df.iloc[:, 0].tolist()))
+            user_filters.append(set(passed["id"].tolist()))
 
     allowed_users = set.intersection(*user_filters) if user_filters else None
     allowed_topics = set.intersection(*topic_filters) if topic_filters else None
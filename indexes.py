@@ -0,0 +1,173 @@
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+import pandas as pd
+
+
+def to_seconds(t):
+    """
+    Convert a post timestamp (pandas/datetime/numpy datetime or epoch int) to int epoch seconds.
+    """
+    if isinstance(t, int):
+        return t
+    if hasattr(t, 'dtype') and t.dtype.kind in 'iu':
+        return int(t)
+    return pd.Timestamp(t).value // 10**9
+
+
+def to_timestamp(t):
+    """
+    Inverse of to_seconds for output: epoch-second ints become pandas Timestamps, others pass through.
+    """
+    if isinstance(t, int) or (hasattr(t, 'dtype') and t.dtype.kind in 'iu'):
+        return pd.Timestamp(int(t), unit='s')
+    return t
+
+
+class ForumIndex:
+    """
+    Lookup structures built once per thread_info:
+    - timeline[u]    → (sorted post times, thread ids, post ids, positions in thread) of user u
+    - first_post     → {(u, thread_id): time of u's first post in that thread}
+    - thread_rank    → {thread_id: position of the thread in thread_info iteration order}
+    - precedence[v]  → {u: (sorted times, thread ids)} where each entry is the last time v posted
+                       in a thread in which u had already posted before it (one entry per thread)
+    """
+
+    def __init__(self, timeline, precedence, first_post=None, thread_rank=None):
+        self.timeline = timeline
+        self.precedence = precedence
+        self.first_post = first_post if first_post is not None else {}
+        self.thread_rank = thread_rank if thread_rank is not None else {}
+
+    def posted_after(self, u, v, since, exclude_thread=None):
+        """
+        True if v posted at or after `since` in a thread (other than exclude_thread)
+        where u had posted before v.
+        """
+        entry = self.precedence.get(v, {}).get(u)
+        if entry is None:
+            return False
+        times, threads = entry
+        for i in range(bisect_left(times, since), len(times)):
+            if threads[i] != exclude_thread:
+                return True
+        return False
+
+    def posts_between(self, u, start, end):
+        """
+        Posts (time, thread_id) of user u with start <= time < end, latest first.
+        """
+        entry = self.timeline.get(u)
+        if entry is None:
+            return []
+        times, threads = entry[0], entry[1]
+        lo, hi = bisect_left(times, start), bisect_left(times, end)
+        return [(times[i], threads[i]) for i in range(hi - 1, lo - 1, -1)]
+
+    def posted_in_thread_before(self, u, thread_id, t):
+        """
+        True if u has a post in thread_id strictly before t.
+        """
+        first = self.first_post.get((u, thread_id))
+        return first is not None and first < t
+
+    def follows_in_window(self, u, v, start, end, exclude_thread=None):
+        """
+        True if v posted with start <= time <= end in a thread (other than exclude_thread)
+        where u had already posted before that post.
+        """
+        entry = self.timeline.get(v)
+        if entry is None:
+            return False
+        times, threads = entry[0], entry[1]
+        for i in range(bisect_left(times, start), bisect_right(times, end)):
+            if threads[i] != exclude_thread and self.posted_in_thread_before(u, threads[i], times[i]):
+                return True
+        return False
+
+    def first_posts_in_window(self, u, start, end, exclude_thread=None):
+        """
+        u's first post (by position) in each thread with start <= time <= end, skipping exclude_thread.
+        Returns [(thread_id, position, post_id), ...] in thread_info iteration order.
+        """
+        entry = self.timeline.get(u)
+        if entry is None:
+            return []
+        times, threads, post_ids, positions = entry
+        first = {}
+        for i in range(bisect_left(times, start), bisect_right(times, end)):
+            thread_id = threads[i]
+            if thread_id != exclude_thread and (thread_id not in first or positions[i] < first[thread_id][1]):
+                first[thread_id] = (thread_id, positions[i], post_ids[i])
+        return sorted(first.values(), key=lambda x: self.thread_rank[x[0]])
+
+
+def build_user_timeline(thread_info):
+    """
+    Per-user sorted post times with the thread id, post id and in-thread position of each post.
+    """
+    posts_by_user = defaultdict(list)
+    for thread_id, posts in thread_info.items():
+        for position, (post_id, user_id, post_time) in enumerate(posts):
+            posts_by_user[user_id].append((to_seconds(post_time), thread_id, post_id, position))
+
+    timeline = {}
+    for user_id, posts in posts_by_user.items():
+        posts.sort(key=lambda x: x[0])
+        timeline[user_id] = tuple(list(column) for column in zip(*posts))
+    return timeline
+
+
+def build_first_post_times(thread_info):
+    """
+    Time of each user's first post in each thread, keyed by (user_id, thread_id).
+    """
+    first_post = {}
+    for thread_id, posts in thread_info.items():
+        for _, user_id, post_time in posts:
+            t = to_seconds(post_time)
+            key = (user_id, thread_id)
+            if key not in first_post or t < first_post[key]:
+                first_post[key] = t
+    return first_post
+
+
+def build_precedence_index(thread_info):
+    """
+    For every thread, record for each ordered pair (u, v) the last time v posted there,
+    provided u's first post in the thread came strictly before it.
+    Keyed by v so callers can walk only the users that ever preceded v.
+    """
+    pairs = defaultdict(lambda: defaultdict(list))
+
+    for thread_id, posts in thread_info.items():
+        first_post, last_post = {}, {}
+        for _, user_id, post_time in posts:
+            t = to_seconds(post_time)
+            if user_id not in first_post or t < first_post[user_id]:
+                first_post[user_id] = t
+            if user_id not in last_post or t > last_post[user_id]:
+                last_post[user_id] = t
+
+        by_first = sorted(first_post.items(), key=lambda x: x[1])
+        for v, t_last in last_post.items():
+            for u, t_first in by_first:
+                if t_first >= t_last:
+                    break
+                if u != v:
+                    pairs[v][u].append((t_last, thread_id))
+
+    precedence = {}
+    for v, by_u in pairs.items():
+        precedence[v] = {}
+        for u, entries in by_u.items():
+            entries.sort(key=lambda x: x[0])
+            precedence[v][u] = ([t for t, _ in entries], [th for _, th in entries])
+    return precedence
+
+
+def build_forum_index(thread_info):
+    return ForumIndex(build_user_timeline(thread_info), build_precedence_index(thread_info),
+                      build_first_post_times(thread_info),
+                      {thread_id: rank for rank, thread_id in enumerate(thread_info)})
@@ -2,8 +2,9 @@ from build_network import build_thread_info, create_user_influence_network, prin
 from sampling import balanced_sampling
 import config
 import pandas as pd
-from filters import apply_filters
 from features import compute_features_for_pairs
+from feature_cache import FeatureCache
+from filters import network_scope
 
 # Load config values
 cfg = config.get_config_all(config)
@@ -12,11 +13,8 @@ t_sus = int(cfg["TAO"]["SUSCEPTIBLE"]) * 3600
 t_fos = int(cfg["TAO"]["FORGETTABLE"]) * 3600
 filters_enabled = list(map(int, cfg["FILTERS"]["ENABLED"]))
 
-# Apply filters
-allowed_users, allowed_topics = apply_filters(forum_id, filters_enabled)
-
-# Build thread info and influence network
-thread_info = build_thread_info(forum_id, allowed_users, allowed_topics)
+# Build thread info (filters, date window and thresholds evaluated in the database) and influence network
+thread_info = build_thread_info(forum_id, active_filters=filters_enabled, scope=network_scope(cfg))
 graph = create_user_influence_network(thread_info)
 thread_list = list(thread_info.keys())
 
@@ -35,6 +33,9 @@ print("Balanced sample stats:")
 print(df_balanced['label'].value_counts())
 print(df_balanced.sample(min(5, len(df_balanced))))
 
+# IAN sets and finished rows are shared between the balanced and imbalanced runs (and reruns)
+feature_cache = FeatureCache(path="outputs/feature_cache.sqlite")
+
 # Extract features for balanced set
 features_balanced = compute_features_for_pairs(
     df=df_balanced,
@@ -42,7 +43,8 @@ features_balanced = compute_features_for_pairs(
     thread_info=thread_info,
     t_sus=t_sus,
     t_fos=t_fos,
-    output_path="outputs/features_on_balanced.csv"
+    output_path="outputs/features_on_balanced.csv",
+    cache=feature_cache
 )
 
 # Extract features for imbalanced set
@@ -53,7 +55,9 @@ features_imbalanced = compute_features_for_pairs(
     thread_info=thread_info,
     t_sus=t_sus,
     t_fos=t_fos,
-    output_path="outputs/features_on_imbalanced.csv"
+    output_path="outputs/features_on_imbalanced.csv",
+    cache=feature_cache
 )
 
+feature_cache.close()
 print("Feature generation complete.")
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+from sklearn.svm import SVC
+from sklearn.metrics import f1_score
+from sklearn.model_selection import train_test_split
+from sklearn.utils import shuffle
+
+
+def split_train_test(balanced_df, imbalanced_df):
+    """
+    Same split as run_svc_model: 80% of the balanced rows for training,
+    the other 20% plus every imbalanced non-adopter (shuffled) for testing.
+    """
+    train_df, test_df_balanced = train_test_split(
+        balanced_df, test_size=0.2, stratify=balanced_df['label'], random_state=42
+    )
+    test_df = pd.concat([
+        test_df_balanced,
+        imbalanced_df[imbalanced_df['label'] == 0]
+    ], ignore_index=True)
+    return train_df, shuffle(test_df, random_state=42)
+
+
+class SubsetKernelSVC:
+    """
+    RBF SVC evaluation over many feature subsets of one train/test split.
+
+    The RBF kernel factors over features: exp(-gamma * sum_f (x_f - y_f)^2). The squared
+    differences of every feature are computed once (train×train and test×train); a subset's
+    Gram matrix is then a sum of its features' matrices, exponentiated, and fitted with
+    kernel='precomputed'. gamma follows SVC's 'scale' on the subset's training columns, so
+    predictions (and F1) match run_svc_model. Probability calibration is skipped: SVC.predict
+    uses the decision function only, so it never changed the score.
+    """
+
+    def __init__(self, balanced_df, imbalanced_df, feature_cols):
+        self.balanced_df = balanced_df
+        self.imbalanced_df = imbalanced_df
+        self.feature_cols = list(feature_cols)
+        self.train_sq = None
+
+    def _prepare(self):
+        self.train_df, self.test_df = split_train_test(self.balanced_df, self.imbalanced_df)
+        self.y_train = self.train_df['label'].to_numpy()
+        self.y_test = self.test_df['label'].to_numpy()
+
+        # Step 1: per-feature squared differences, computed once
+        self.train_sq = {}
+        self.test_sq = {}
+        for col in self.feature_cols:
+            train = self.train_df[col].to_numpy(dtype=np.float64)
+            test = self.test_df[col].to_numpy(dtype=np.float64)
+            self.train_sq[col] = np.subtract.outer(train, train) ** 2
+            self.test_sq[col] = np.subtract.outer(test, train) ** 2
+
+    def gamma(self, feature_cols):
+        # SVC(gamma='scale'): 1 / (n_features * X.var()) over the training matrix
+        X = np.ascontiguousarray(self.train_df[list(feature_cols)].to_numpy(dtype=np.float64))
+        X_var = X.var()
+        return 1.0 / (X.shape[1] * X_var) if X_var != 0 else 1.0
+
+    def f1(self, feature_cols):
+        """
+        Rounded F1 of an RBF SVC on feature_cols (a subset of the engine's columns), or None on error.
+        """
+        try:
+            if self.train_sq is None:
+                self._prepare()
+            gamma = self.gamma(feature_cols)
+
+            # Step 2: subset Gram matrices from the stored per-feature distances
+            train_dist = sum(self.train_sq[col] for col in feature_cols)
+            test_dist = sum(self.test_sq[col] for col in feature_cols)
+
+            # Step 3: fit and predict on the precomputed kernels
+            model = SVC(kernel='precomputed', random_state=42)
+            model.fit(np.exp(-gamma * train_dist), self.y_train)
+            y_pred = model.predict(np.exp(-gamma * test_dist))
+
+            return round(f1_score(self.y_test, y_pred), 4)
+
+        except Exception as e:
+            print(f"[Model Error] {e}")
+            return None
@@ -3,6 +3,12 @@ import seaborn as sns
 import matplotlib.pyplot as plt
 import os
 
+from results_store import load_results
+
+# Stored run to plot (see results_store.load_results): e.g. features=["nan", "pne", "hub"], max_pairs=500,
+# or screening=True for a successive-halving run
+RESULTS_RUN = {"forum_id": 2, "features": None, "seed": None, "max_pairs": None, "screening": False}
+
 
 def plot_negatives_per_positive():
     RESULTS_CSV = "experiment_results_forum2/avg_negatives_per_positive.csv"
@@ -14,7 +20,7 @@ def plot_negatives_per_positive():
         "3": "users_per_thread"
     }
 
-    df = pd.read_csv(RESULTS_CSV)
+    df = load_results("tao", RESULTS_CSV, **RESULTS_RUN)
 
     if "avg_negatives_per_positive" not in df.columns:
         print("Missing 'avg_negatives_per_positive' column.")
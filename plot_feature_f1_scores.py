@@ -2,9 +2,14 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import os
 
+from results_store import load_results
+
 # === Config ===
 CSV_PATH = "experiment_results_forum2/feature_eval_f1_scores.csv"
 OUTPUT_DIR = "experiment_results_forum2"
+# Stored run to plot (see results_store.load_results): e.g. tao=(365, 365), max_pairs=500,
+# or screening=True for a successive-halving run
+RESULTS_RUN = {"forum_id": 2, "tao": None, "seed": None, "max_pairs": None, "screening": False}
 
 # Mapping from filter index to name
 FILTER_NAMES = {
@@ -19,8 +24,8 @@ def decode_filter_names(filter_str):
     clean = filter_str.replace("[", "").replace("]", "").replace(" ", "")
     return [FILTER_NAMES.get(f, f) for f in clean.split(",") if f]
 
-# === Load results ===
-df = pd.read_csv(CSV_PATH)
+# === Load results (results store, or the CSV of an older run) ===
+df = load_results("features", CSV_PATH, **RESULTS_RUN)
 df["filters"] = df["filters"].astype(str)
 
 # === Plot each filter group ===
@@ -32,8 +37,13 @@ for filters, group in df.groupby("filters"):
     filter_names = decode_filter_names(filters)
     filter_text = "Filters used:\n" + ", ".join(filter_names)
 
+    # Screening results: configurations eliminated early are greyed out
+    eliminated = group["eliminated_at"].tolist() if "eliminated_at" in group.columns else [None] * len(scores)
+    colors = ["skyblue" if pd.isna(cut) else "lightgray" for cut in eliminated]
+    scores = [0 if pd.isna(score) else score for score in scores]
+
     plt.figure(figsize=(6, 6))
-    bars = plt.bar(x, scores, color="skyblue", width=0.3)
+    bars = plt.bar(x, scores, color=colors, width=0.3)
 
     plt.xticks(x, features, rotation=45, ha="right")
     plt.xlabel("Feature Combinations")
@@ -43,10 +53,11 @@ for filters, group in df.groupby("filters"):
     plt.grid(axis='y', linestyle='--', alpha=0.5)
 
     # Add score values on top of each bar
-    for bar in bars:
+    for bar, cut in zip(bars, eliminated):
         height = bar.get_height()
+        label = f"{height:.2f}" if pd.isna(cut) else f"{height:.2f}\n✗{int(cut)}"
         plt.text(bar.get_x() + bar.get_width()/2, height + 0.02,
-                 f"{height:.2f}", ha='center', va='bottom', fontsize=9)
+                 label, ha='center', va='bottom', fontsize=9)
 
     # # Add filter names as annotation box
     # plt.gcf().text(0.5, 0.85, filter_text, fontsize=10, va='top', ha='left',
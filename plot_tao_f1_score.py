@@ -59,11 +59,17 @@ import seaborn as sns
 import matplotlib.pyplot as plt
 import os
 
+from results_store import load_results
+
+# Stored run to plot (see results_store.load_results): e.g. features=["nan", "pne", "hub"], max_pairs=500,
+# or screening=True for a successive-halving run
+RESULTS_RUN = {"forum_id": 2, "features": None, "seed": None, "max_pairs": None, "screening": False}
+
 def plot_tao_f1_score():
     RESULTS_CSV = "experiment_results_forum2/tao_eval_f1_scores.csv"
 
-    # Read results
-    df = pd.read_csv(RESULTS_CSV)
+    # Read results (results store, or the CSV of an older run)
+    df = load_results("tao", RESULTS_CSV, **RESULTS_RUN)
     df["f1_score"] = df["f1_score"].fillna(0)
     df["filters"] = df["filters"].astype(str)
 
@@ -78,13 +84,25 @@ def plot_tao_f1_score():
     # Plot heatmap for each filter set
     for f in df["filters"].unique():
         df_f = df[df["filters"] == f]
-        heatmap_data = df_f.pivot(index="t_sus", columns="t_fos", values="f1_score").fillna(0)
+        # TAO points missing from partial results stay blank
+        heatmap_data = df_f.pivot(index="t_sus", columns="t_fos", values="f1_score")
+
+        # Screening results: mark points eliminated early with the budget they were scored at
+        annot, fmt = True, ".3f"
+        if "eliminated_at" in df_f.columns:
+            labels = df_f.assign(label=[
+                f"{score:.3f}" if pd.isna(cut) else f"{score:.3f}\n✗{int(cut)}"
+                for score, cut in zip(df_f["f1_score"], df_f["eliminated_at"])
+            ])
+            annot = labels.pivot(index="t_sus", columns="t_fos", values="label").fillna("")
+            annot = annot.reindex(index=heatmap_data.index, columns=heatmap_data.columns).to_numpy()
+            fmt = ""
 
         plt.figure(figsize=(10, 6))
         sns.heatmap(
             heatmap_data,
-            annot=True,
-            fmt=".3f",
+            annot=annot,
+            fmt=fmt,
             cmap="YlGnBu",
             cbar_kws={'label': 'F1 Score'}
         )
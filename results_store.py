@@ -0,0 +1,208 @@
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import pandas as pd
+
+from filters import network_scope, normalize_scope
+
+# Results of automate_tao / automate_features / experiment_runner, one row per finished configuration
+RESULTS_DB = "experiment_results_forum2/results.sqlite"
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS results (
+        key TEXT PRIMARY KEY,
+        experiment TEXT NOT NULL,        -- 'tao' or 'features'
+        forum_id INTEGER,
+        filters TEXT,                    -- e.g. '[0, 1, 2, 3]'
+        t_sus INTEGER,                   -- seconds
+        t_fos INTEGER,                   -- seconds
+        features TEXT,                   -- e.g. 'nan+pne+hub'
+        max_pairs INTEGER,
+        seed INTEGER,
+        scope TEXT,                      -- date window and network thresholds, as JSON
+        hub_percentile REAL,
+        f1_score REAL,
+        avg_negatives_per_positive REAL,
+        created REAL
+    )
+"""
+
+
+class ResultsStore:
+    """
+    Append-only SQLite store of experiment results, keyed by a hash of the experiment and
+    (forum, filters, t_sus, t_fos, features, max_pairs, seed, scope, hub_percentile).
+
+    Every result is committed as soon as it is recorded, so an interrupted run loses at most
+    the configuration in progress; a rerun looks each key up and skips the ones already done.
+    A key is written once: recording it again keeps the first result.
+    """
+
+    def __init__(self, path=RESULTS_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(SCHEMA)
+            # Stores created before the scope columns existed
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(results)")}
+            for column, kind in (("scope", "TEXT"), ("hub_percentile", "REAL")):
+                if column not in columns:
+                    connection.execute(f"ALTER TABLE results ADD COLUMN {column} {kind}")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=60)
+
+    @staticmethod
+    def config(forum_id, filters, t_sus, t_fos, features, max_pairs, seed, scope=None, hub_percentile=0.1):
+        """
+        Normalized configuration (TAO in seconds, feature names lower-case, in the given order).
+        scope is the data's date window and thresholds (default: network_scope() from config.yaml).
+        """
+        scope = network_scope() if scope is None else normalize_scope(scope)
+        return {
+            "forum_id": int(forum_id),
+            "filters": str([int(f) for f in filters]),
+            "t_sus": int(t_sus),
+            "t_fos": int(t_fos),
+            "features": "+".join(f.lower() for f in features),
+            "max_pairs": int(max_pairs),
+            "seed": None if seed is None else int(seed),
+            "scope": json.dumps(scope, sort_keys=True, default=str),
+            "hub_percentile": float(hub_percentile),
+        }
+
+    @staticmethod
+    def key(experiment, config):
+        return hashlib.sha1(json.dumps([experiment, config], sort_keys=True).encode()).hexdigest()[:20]
+
+    def get(self, key):
+        """
+        The stored result row for key (a dict), or None if that configuration has not finished.
+        """
+        with self._connect() as connection:
+            connection.row_factory = sqlite3.Row
+            row = connection.execute("SELECT * FROM results WHERE key = ?", (key,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def done(self):
+        with self._connect() as connection:
+            return {key for (key,) in connection.execute("SELECT key FROM results")}
+
+    def record(self, experiment, config, f1_score, avg_negatives_per_positive=None):
+        key = self.key(experiment, config)
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR IGNORE INTO results (key, experiment, forum_id, filters, t_sus, t_fos, features, "
+                "max_pairs, seed, scope, hub_percentile, f1_score, avg_negatives_per_positive, created) "
+                "VALUES (:key, :experiment, :forum_id, :filters, :t_sus, :t_fos, :features, "
+                ":max_pairs, :seed, :scope, :hub_percentile, :f1_score, :avg_negatives_per_positive, :created)",
+                {**config, "key": key, "experiment": experiment, "f1_score": f1_score,
+                 "avg_negatives_per_positive": avg_negatives_per_positive, "created": time.time()})
+        return key
+
+    def frame(self, experiment, forum_id=None):
+        query = "SELECT * FROM results WHERE experiment = ?"
+        params = [experiment]
+        if forum_id is not None:
+            query += " AND forum_id = ?"
+            params.append(forum_id)
+        with self._connect() as connection:
+            return pd.read_sql_query(query + " ORDER BY rowid", connection, params=params)
+
+
+def cached_result(store, experiment, config, evaluate):
+    """
+    The stored (f1_score, avg_negatives_per_positive) of config, or evaluate()'s result
+    (either an F1 score or that pair), recorded before it is returned. A None F1 score
+    (a failed model) is not recorded, so the next run tries that configuration again.
+    """
+    row = store.get(store.key(experiment, config))
+    if row is not None:
+        print(f"Skipping completed configuration {config}.")
+        return row["f1_score"], row["avg_negatives_per_positive"]
+
+    result = evaluate()
+    f1_score, avg_neg_per_pos = result if isinstance(result, tuple) else (result, None)
+    if f1_score is None:
+        print(f"No F1 score for {config}; not recorded, it will be retried on the next run.")
+    else:
+        store.record(experiment, config, f1_score, avg_neg_per_pos)
+    return f1_score, avg_neg_per_pos
+
+
+def load_results(experiment, csv_path, forum_id=None, features=None, tao=None, seed=None, max_pairs=None,
+                 scope=None, hub_percentile=None, screening=False, path=RESULTS_DB):
+    """
+    Results in the layout of the automate_tao / automate_features CSVs, read from the store
+    (falling back to csv_path while the store has none). TAO windows are in days.
+
+    The CSV layout has one row per filter set and TAO point (tao) or feature set (features), so
+    the other settings must be single-valued: narrow them with forum_id, features (tao runs),
+    tao=(t_sus_days, t_fos_days) (feature runs), seed, max_pairs, scope (a network_scope() dict)
+    and hub_percentile. Mixed runs raise ValueError.
+    With screening=True, configurations scored at several budgets (successive halving) keep
+    their row at the largest one, with budget and eliminated_at columns as in a screening run.
+    """
+    df = ResultsStore(path).frame(experiment, forum_id) if os.path.exists(path) else pd.DataFrame()
+    if df.empty:
+        return pd.read_csv(csv_path)
+
+    df["t_sus"] = df["t_sus"] // (24 * 3600)
+    df["t_fos"] = df["t_fos"] // (24 * 3600)
+    df["features"] = df["features"].str.upper()
+
+    # Narrow to one run
+    if features is not None:
+        df = df[df["features"] == "+".join(f.upper() for f in features)]
+    if tao is not None:
+        df = df[(df["t_sus"] == tao[0]) & (df["t_fos"] == tao[1])]
+    if seed is not None:
+        df = df[df["seed"] == seed]
+    if max_pairs is not None:
+        df = df[df["max_pairs"] == max_pairs]
+    if scope is not None:
+        df = df[df["scope"] == json.dumps(normalize_scope(scope), sort_keys=True, default=str)]
+    if hub_percentile is not None:
+        df = df[df["hub_percentile"] == hub_percentile]
+
+    # Settings the CSV layout has no column for must be single-valued
+    hidden = {"forum_id": ["forum_id"], "seed": ["seed"], "scope": ["scope"], "hub_percentile": ["hub_percentile"]}
+    if experiment == "tao":
+        hidden["features"] = ["features"]
+    else:
+        hidden["tao"] = ["t_sus", "t_fos"]
+    for option, columns in hidden.items():
+        values = [tuple(v) if len(v) > 1 else v[0] for v in df[columns].drop_duplicates().values.tolist()]
+        if len(values) > 1:
+            raise ValueError(f"Stored {experiment} results mix several {option} values {values}; "
+                             f"pick one with {option}=...")
+    if df["max_pairs"].nunique() > 1 and not screening:
+        raise ValueError(f"Stored {experiment} results mix max_pairs {sorted(df['max_pairs'].unique().tolist())}; "
+                         f"pick one with max_pairs=... (or screening=True for a successive-halving run).")
+
+    # Keep the largest budget per configuration, in first-finished order
+    config_columns = ["filters", "t_sus", "t_fos", "features"]
+    order = df.drop_duplicates(config_columns)[config_columns]
+    df = df.sort_values("max_pairs").drop_duplicates(config_columns, keep="last")
+    df = order.merge(df, on=config_columns, how="left")
+
+    columns = (["filters", "t_sus", "t_fos", "f1_score", "avg_negatives_per_positive"] if experiment == "tao"
+               else ["filters", "features", "f1_score"])
+    out = df[columns].copy()
+    if screening:
+        out["budget"] = df["max_pairs"]
+        out["eliminated_at"] = df["max_pairs"].where(df["max_pairs"] < df["max_pairs"].max())
+    return out
+
+
+if __name__ == "__main__":
+    # python results_store.py [tao|features]  → print stored results
+    store = ResultsStore()
+    for experiment in sys.argv[1:] or ["tao", "features"]:
+        print(f"=== {experiment} results in {store.path} ===")
+        print(store.frame(experiment).drop(columns=["key", "created"]).to_string(index=False))
@@ -1,30 +1,267 @@
 import random
+from bisect import bisect_left
 from datetime import datetime
 import csv
+import multiprocessing
 import os
 
-import pandas as pd
+import numpy as np
 from tqdm import tqdm
 
+from indexes import build_forum_index, to_seconds, to_timestamp
+
+
+def _csv_row(row):
+    # Write post times as timestamps whether thread_info holds Timestamps or epoch seconds
+    row = list(row)
+    row[3], row[6] = to_timestamp(row[3]), to_timestamp(row[6])
+    return row
+
+def _find_valid_v1(posts_in_thread, index, t_sus, t_fos, thread_id, v_user, v_post_time, times=None):
+    """
+    Steps 2–3: earliest post in θ (before v, within t_fos) whose author v1 is an active neighbor of v,
+    i.e. v posted within t_sus before that post in another thread where v1 had posted before v.
+    times: the thread's post times in seconds, if the posts are time-sorted, to bisect the t_fos window.
+    Returns (position in thread, post_id_v1, v1_user, v1_post_time) or None.
+    """
+    t_v = to_seconds(v_post_time)
+    lo, hi = 0, len(posts_in_thread)
+    if times is not None:
+        lo, hi = bisect_left(times, t_v - t_fos), bisect_left(times, t_v)
+
+    # Step 2: Find valid v1 (influential active neighbor)
+    potential_v1s = []
+    for position in range(lo, hi):
+        pid1, u1, t1 = posts_in_thread[position]
+        if t1 >= v_post_time or u1 == v_user:
+            continue
+        if t_v - to_seconds(t1) <= t_fos:
+            potential_v1s.append((position, pid1, u1, t1))
+
+    potential_v1s.sort(key=lambda x: x[3])  # Sort by time (earliest first)
+
+    # Step 3: Cross-thread validation of v1 (stop at first valid v1)
+    for position, post_id_v1, v1_user, v1_post_time in potential_v1s:
+        t_v1 = to_seconds(v1_post_time)
+        if index.follows_in_window(v1_user, v_user, t_v1 - t_sus, t_v1, exclude_thread=thread_id):
+            return position, post_id_v1, v1_user, v1_post_time
+
+    return None
+
+
+ELIGIBLE_DTYPE = [("thread_id", "i8"), ("position", "i4"), ("v1_position", "i4")]
+
+
+def find_eligible_posts(thread_info, t_sus, t_fos, index=None):
+    """
+    One pass over the forum finding every post that has a valid v1 under t_sus/t_fos.
+    Returns a structured array of (thread_id, position of v, position of its v1) and prints
+    forum-level eligibility statistics.
+    """
+    if index is None:
+        index = build_forum_index(thread_info)
+
+    eligible = []
+    total_posts = 0
+    for thread_id, posts in tqdm(thread_info.items(), desc="Indexing eligible posts"):
+        times = [to_seconds(t) for _, _, t in posts]
+        if any(a > b for a, b in zip(times, times[1:])):
+            times = None  # Not time-sorted: scan the whole thread
+        for position, (post_id, user_id, post_time) in enumerate(posts):
+            total_posts += 1
+            found = _find_valid_v1(posts, index, t_sus, t_fos, thread_id, user_id, post_time, times)
+            if found is not None:
+                eligible.append((thread_id, position, found[0]))
+
+    eligible = np.array(eligible, dtype=ELIGIBLE_DTYPE)
+    stats = eligibility_stats(eligible, thread_info, total_posts)
+    print(f"Eligible v posts: {stats['eligible_posts']} of {stats['total_posts']} "
+          f"({stats['eligible_ratio']:.1%}) in {stats['eligible_threads']} of {stats['total_threads']} threads, "
+          f"{stats['eligible_users']} distinct users.")
+    return eligible
+
+
+def eligibility_stats(eligible, thread_info, total_posts=None):
+    if total_posts is None:
+        total_posts = sum(len(posts) for posts in thread_info.values())
+    posts_by_thread = {}
+    users = set()
+    for thread_id, position, _ in eligible.tolist():
+        if thread_id not in posts_by_thread:
+            posts_by_thread[thread_id] = thread_info[thread_id]
+        users.add(posts_by_thread[thread_id][position][1])
+    return {
+        "total_posts": total_posts,
+        "total_threads": len(thread_info),
+        "eligible_posts": len(eligible),
+        "eligible_ratio": len(eligible) / total_posts if total_posts else 0.0,
+        "eligible_threads": len(np.unique(eligible["thread_id"])),
+        "eligible_users": len(users),
+    }
+
+
+def negative_candidates(G, index, v1_user, v_user, thread_id, t_v):
+    """
+    Successors of v1 other than v that had not posted in thread θ before v (iteration order matters
+    for the seeded negative choice).
+    """
+    candidates = set(G.successors(v1_user))
+
+    # Filter out users who already posted in thread θ before v
+    return {
+        v_prime for v_prime in candidates
+        if v_prime != v_user and not index.posted_in_thread_before(v_prime, thread_id, t_v)
+    }
+
+
+def _sample_candidate(thread_info, G, t_sus, t_fos, candidate, rng, index, known_v1=None):
+    """
+    Steps 2–5 for one candidate (v) post. Returns (balanced rows, imbalanced rows, negative count)
+    or None if the post has no valid v1 or no valid negatives.
+    known_v1 maps post_id → v1 position in its thread, from find_eligible_posts.
+    """
+    thread_id, post_id_v, v_user, v_post_time = candidate
+    posts_in_thread = thread_info[thread_id]
+
+    if known_v1 is not None:
+        post_id_v1, v1_user, v1_post_time = posts_in_thread[known_v1[post_id_v]]
+    else:
+        found_valid_v1 = _find_valid_v1(posts_in_thread, index, t_sus, t_fos, thread_id, v_user, v_post_time)
+        if not found_valid_v1:
+            return None  # Skip if no valid v1
+        _, post_id_v1, v1_user, v1_post_time = found_valid_v1
+
+    # Step 4: Identify all valid v′ (negatives)
+    t_v, t_v1 = to_seconds(v_post_time), to_seconds(v1_post_time)
+    candidates = negative_candidates(G, index, v1_user, v_user, thread_id, t_v)
+
+    valid_negatives = []
+
+    # v′ must have posted outside θ within t_sus before v1 (and before v);
+    # one negative per such thread: v′'s first qualifying post there
+    for v_prime in candidates:
+        for topic2, position, post_id2 in index.first_posts_in_window(v_prime, t_v1 - t_sus, min(t_v1, t_v - 1),
+                                                                      exclude_thread=thread_id):
+            valid_negatives.append((v_prime, post_id2, thread_info[topic2][position][2]))
+
+    if not valid_negatives:
+        return None
+
+    return sample_rows(candidate, post_id_v1, v1_user, v1_post_time, valid_negatives, rng)
+
+
+def sample_rows(candidate, post_id_v1, v1_user, v1_post_time, valid_negatives, rng):
+    """
+    Step 5: rows for one accepted (v) post given its v1 and non-empty list of (v′, post_id, time).
+    """
+    thread_id, post_id_v, v_user, v_post_time = candidate
+
+    # Step 5: Randomly choose one v′ for balanced set
+    v_prime_chosen, post_id_v_prime, v_prime_post_time = rng.choice(valid_negatives)
+
+    # Add to balanced dataset: (v) and chosen (v′)
+    balanced_rows = [
+        (thread_id, post_id_v, v_user, v_post_time, post_id_v1, v1_user, v1_post_time, 1),
+        (thread_id, post_id_v_prime, v_prime_chosen, v_prime_post_time, post_id_v1, v1_user, v1_post_time, 0),
+    ]
+
+    # Add all valid v′ to imbalanced dataset
+    imbalanced_rows = []
+    for v_prime, post_id_vp, t_vp in valid_negatives:
+        if (v_prime, post_id_vp, t_vp) == (v_prime_chosen, post_id_v_prime, v_prime_post_time):
+            continue
+        imbalanced_rows.append((thread_id, post_id_vp, v_prime, t_vp,
+                                post_id_v1, v1_user, v1_post_time, 0))
+
+    return balanced_rows, imbalanced_rows, (v_user, post_id_v, len(valid_negatives))
+
+
+def candidate_rng(seed, post_id):
+    """
+    RNG of one candidate (v) post: seeded per post so the chosen negative does not depend on
+    how candidates are split (also used by tao_sweep.ThresholdSweep).
+    """
+    return random.Random(f"{seed}:{post_id}")
+
+
+_sampling_context = None
+
+
+def _sample_chunk(task):
+    chunk_id, chunk = task
+    thread_info, G, t_sus, t_fos, seed, done, index, known_v1 = _sampling_context
+    accepted = []
+    for candidate in chunk:
+        if done.is_set():
+            break  # Quota already met by earlier chunks
+        result = _sample_candidate(thread_info, G, t_sus, t_fos, candidate, candidate_rng(seed, candidate[1]), index,
+                                   known_v1)
+        if result is not None:
+            accepted.append(result)
+    return chunk_id, accepted
+
+
+def _sample_parallel(thread_info, G, t_sus, t_fos, all_posts, needed, seed, workers, index, known_v1=None,
+                     chunk_size=64):
+    """
+    Evaluate shuffled candidates in ordered chunks on a fork-based pool, merging accepted posts
+    in shuffle order and stopping once `needed` posts are accepted.
+    """
+    global _sampling_context
+
+    mp = multiprocessing.get_context("fork")
+    done = mp.Event()
+    tasks = [(i, all_posts[start:start + chunk_size]) for i, start in enumerate(range(0, len(all_posts), chunk_size))]
+
+    accepted = []
+    _sampling_context = (thread_info, G, t_sus, t_fos, seed, done, index, known_v1)
+    try:
+        # Not `with mp.Pool(...)`: its exit terminates the pool, which can hang while the task
+        # handler is still feeding the queue. Once `done` is set the remaining chunks return
+        # immediately, so closing and joining is quick.
+        pool = mp.Pool(workers)
+        try:
+            for _, chunk_accepted in tqdm(pool.imap(_sample_chunk, tasks), total=len(tasks), desc="Sampling chunks"):
+                accepted.extend(chunk_accepted)
+                if len(accepted) >= needed:
+                    done.set()
+                    break
+            pool.close()
+            pool.join()
+        except BaseException:
+            pool.terminate()
+            raise
+    finally:
+        _sampling_context = None
+
+    return accepted[:needed]
+
+
 def balanced_sampling(thread_info, G, t_sus, t_fos, max_pairs=600,
                       balanced_output="outputs/balanced_samples.csv",
-                      imbalanced_output="outputs/imbalanced_samples.csv"):
+                      imbalanced_output="outputs/imbalanced_samples.csv",
+                      seed=None, workers=1, index=None, eligible=None,
+                      negatives_output="outputs/negatives_per_positive.csv"):
     """
     Balanced Sampling with separate storage of all valid negatives for imbalanced evaluation.
 
     Args:
-        thread_info: Dictionary of thread_id → list of (post_id, user_id, timestamp)
+        thread_info: Dictionary (or ThreadInfo) of thread_id → list of (post_id, user_id, timestamp)
         G: MultiDiGraph of user influence edges
         t_sus: Susceptibility window in seconds
         t_fos: Forgettability window in seconds
         max_pairs: Maximum (v, v′) pairs to generate
         balanced_output: Path to write balanced (v, v′) dataset
         imbalanced_output: Path to write imbalanced negatives for each v
+        seed: Seed for the shuffle and per-post negative choice; the same seed gives the same
+              samples for any number of workers. None uses the global random state.
+        workers: Number of processes evaluating candidates in parallel (fork start method)
+        index: ForumIndex of thread_info (built here if not given)
+        eligible: Output of find_eligible_posts; if given, only those posts are checked
+                  (same samples as without it, for the same seed)
+        negatives_output: Path to write the negative count per positive
     """
 
-    balanced_data = []      # Final balanced dataset with 1 positive and 1 sampled negative per pair
-    imbalanced_data = []    # Dataset containing all valid negatives per positive
-    visited_post_ids = set()  # Avoid reusing the same post
     all_posts = []            # Flattened list of all posts
 
     # Step 0: Collect all posts into one list
@@ -32,108 +269,66 @@ def balanced_sampling(thread_info, G, t_sus, t_fos, max_pairs=600,
         for post_id, user_id, timestamp in posts:
             all_posts.append((thread_id, post_id, user_id, timestamp))
 
-    random.shuffle(all_posts)  # Randomize sampling order
-    negative_counts = []
-    sampled_pairs = 0  # Track total sampled pairs (each = 1 pos + 1 neg)
-
-    # Step 1: Loop through each post to check if it's a valid (v) post
-    for thread_id, post_id_v, v_user, v_post_time in tqdm(all_posts, desc="Sampling posts"):
-        if post_id_v in visited_post_ids:
-            continue  # Skip already used posts
-
-        posts_in_thread = thread_info[thread_id]
-
-        # Step 2: Find valid v1 (influential active neighbor)
-        potential_v1s = []
-        for pid1, u1, t1 in posts_in_thread:
-            if t1 >= v_post_time or u1 == v_user:
-                continue
-            if (v_post_time - t1).total_seconds() <= t_fos:
-                potential_v1s.append((pid1, u1, t1))
-
-        potential_v1s.sort(key=lambda x: x[2])  # Sort by time (earliest first)
-
-        found_valid_v1 = None
-
-        # Step 3: Cross-thread validation of v1
-        for post_id_v1, v1_user, v1_post_time in potential_v1s:
-            cross_thread_valid = False
-            for topic2, posts2 in thread_info.items():
-                if topic2 == thread_id:
-                    continue  # Must be another thread
-
-                for post_id2, u2, t2 in posts2:
-                    if u2 == v_user:
-                        for post_id3, u3, t3 in posts2:
-                            if u3 == v1_user and t3 < t2:
-                                if 0 <= (v1_post_time - t2).total_seconds() <= t_sus:
-                                    cross_thread_valid = True
-                                    break
-                        if cross_thread_valid:
-                            break
-                if cross_thread_valid:
+    if index is None:
+        index = build_forum_index(thread_info)
+
+    if workers > 1 and "fork" not in multiprocessing.get_all_start_methods():
+        print("Parallel sampling needs the fork start method; sampling serially.")
+        workers = 1
+    if seed is None and workers > 1:
+        seed = random.getrandbits(64)
+
+    if seed is None:
+        random.shuffle(all_posts)  # Randomize sampling order
+    else:
+        random.Random(seed).shuffle(all_posts)
+
+    # Keep only posts known to have a valid v1, in shuffle order
+    known_v1 = None
+    if eligible is not None:
+        known_v1, posts_by_thread = {}, {}
+        for thread_id, position, v1_position in eligible.tolist():
+            if thread_id not in posts_by_thread:
+                posts_by_thread[thread_id] = thread_info[thread_id]
+            known_v1[posts_by_thread[thread_id][position][0]] = v1_position
+        all_posts = [p for p in all_posts if p[1] in known_v1]
+
+    needed = max(1, -(-max_pairs // 2))  # Accepted (v) posts to reach max_pairs
+
+    # Steps 1–5: Check each post as a (v) post, serially or on a worker pool
+    if workers > 1:
+        accepted = _sample_parallel(thread_info, G, t_sus, t_fos, all_posts, needed, seed, workers, index,
+                                    known_v1)
+    else:
+        accepted = []
+        for candidate in tqdm(all_posts, desc="Sampling posts"):
+            rng = random if seed is None else candidate_rng(seed, candidate[1])
+            result = _sample_candidate(thread_info, G, t_sus, t_fos, candidate, rng, index, known_v1)
+            if result is not None:
+                accepted.append(result)
+                if len(accepted) >= needed:
                     break
 
-            if cross_thread_valid:
-                found_valid_v1 = (v1_user, v1_post_time, post_id_v1)
-                break  # Stop at first valid v1
+    return write_samples(accepted, balanced_output, imbalanced_output, negatives_output)
 
-        if not found_valid_v1:
-            continue  # Skip if no valid v1
-
-        v1_user, v1_post_time, post_id_v1 = found_valid_v1
-
-        # Step 4: Identify all valid v′ (negatives)
-        candidates = set(G.successors(v1_user))
-
-        # Filter out users who already posted in thread θ before v
-        candidates = {
-            v_prime for v_prime in candidates
-            if v_prime != v_user and not any(
-                t_p < v_post_time and u_p == v_prime
-                for (p_id, u_p, t_p) in posts_in_thread
-            )
-        }
-
-        valid_negatives = []
-
-        for v_prime in candidates:
-            for topic2, posts2 in thread_info.items():
-                if topic2 == thread_id:
-                    continue  # Skip thread θ
-
-                for post_id2, u2, t2 in posts2:
-                    if u2 == v_prime and pd.to_datetime(t2) < pd.to_datetime(v_post_time):
-                        time_gap = (pd.to_datetime(v1_post_time) - pd.to_datetime(t2)).total_seconds()
-                        if 0 <= time_gap <= t_sus:
-                            valid_negatives.append((v_prime, post_id2, t2))
-                            break
-
-        if valid_negatives:
-            # Step 5: Randomly choose one v′ for balanced set
-            v_prime_chosen, post_id_v_prime, v_prime_post_time = random.choice(valid_negatives)
-
-            # Add to balanced dataset: (v) and chosen (v′)
-            balanced_data.append((thread_id, post_id_v, v_user, v_post_time,
-                                  post_id_v1, v1_user, v1_post_time, 1))
-            balanced_data.append((thread_id, post_id_v_prime, v_prime_chosen, v_prime_post_time,
-                                  post_id_v1, v1_user, v1_post_time, 0))
-
-            # Add all valid v′ to imbalanced dataset
-            for v_prime, post_id_vp, t_vp in valid_negatives:
-                if (v_prime, post_id_vp, t_vp) == (v_prime_chosen, post_id_v_prime, v_prime_post_time):
-                    continue
-                imbalanced_data.append((thread_id, post_id_vp, v_prime, t_vp,
-                                        post_id_v1, v1_user, v1_post_time, 0))
-
-            # Save negative count for this positive
-            negative_counts.append((v_user, post_id_v, len(valid_negatives)))
-
-            visited_post_ids.add(post_id_v)
-            sampled_pairs += 2
-
-        if sampled_pairs >= max_pairs:
-            break
+
+def write_samples(accepted, balanced_output="outputs/balanced_samples.csv",
+                  imbalanced_output="outputs/imbalanced_samples.csv",
+                  negatives_output="outputs/negatives_per_positive.csv"):
+    """
+    Steps 6–8: write the balanced, imbalanced and negatives-per-positive CSVs
+    from accepted (balanced rows, imbalanced rows, negative count) results.
+    """
+    balanced_data = []
+    imbalanced_data = []
+    negative_counts = []
+    sampled_pairs = 0
+
+    for balanced_rows, imbalanced_rows, negative_count in accepted:
+        balanced_data.extend(balanced_rows)
+        imbalanced_data.extend(imbalanced_rows)
+        negative_counts.append(negative_count)  # Save negative count for this positive
+        sampled_pairs += 2
 
     # Step 6: Write balanced dataset to CSV
     os.makedirs(os.path.dirname(balanced_output), exist_ok=True)
@@ -142,7 +337,7 @@ def balanced_sampling(thread_info, G, t_sus, t_fos, max_pairs=600,
         writer.writerow(["thread_id", "post_id", "user_id", "timestamp",
                          "v1_post_id", "v1_user_id", "v1_timestamp", "label"])
         for row in balanced_data:
-            writer.writerow(row)
+            writer.writerow(_csv_row(row))
     print(f"Balanced dataset written to {balanced_output}")
 
     # Step 7: Write imbalanced dataset to CSV
@@ -151,16 +346,16 @@ def balanced_sampling(thread_info, G, t_sus, t_fos, max_pairs=600,
         writer.writerow(["thread_id", "post_id", "user_id", "timestamp",
                          "v1_post_id", "v1_user_id", "v1_timestamp", "label"])
         for row in imbalanced_data:
-            writer.writerow(row)
+            writer.writerow(_csv_row(row))
     print(f"Imbalanced dataset written to {imbalanced_output}")
 
     # Step 8: Save negative count per positive
-    with open("outputs/negatives_per_positive.csv", "w", newline="") as f:
+    with open(negatives_output, "w", newline="") as f:
         writer = csv.writer(f)
         writer.writerow(["user_id", "post_id", "negatives_count"])
         for user_id, post_id, count in negative_counts:
             writer.writerow([user_id, post_id, count])
-    print("Negative count per positive saved to outputs/negatives_per_positive.csv")
+    print(f"Negative count per positive saved to {negatives_output}")
 
     print(f"Finished sampling {sampled_pairs} positive-negative user pairs.")
     return balanced_data
@@ -0,0 +1,140 @@
+import sys
+
+from connect import pooled_connection, WATERMARK_QUERY
+from filters import FILTER_FLAGS_QUERY, filtered_posts_query, scope_params
+from build_network import (THREAD_POSTS_QUERY, THREAD_POSTS_RANGE_QUERY, TOPIC_RANGES_QUERY,
+                           EDGE_AGGREGATE_QUERY, NODE_QUERY)
+
+# Indexes the project queries rely on. All are built CONCURRENTLY so the shared database stays writable.
+SCHEMA_INDEXES = {
+    # Post scans per topic, already ordered by time, answered from the index alone:
+    # the partial predicate matches the queries' LENGTH filter, so post bodies are never detoasted
+    "posts_topic_date_user_idx": """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS posts_topic_date_user_idx
+        ON posts (topic_id, dateadded_post, user_id) INCLUDE (post_id)
+        WHERE LENGTH(content_post) > 10
+    """,
+    # Content length as an expression index: lets the planner estimate (and use) other length cut-offs
+    "posts_content_length_idx": """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS posts_content_length_idx
+        ON posts ((LENGTH(content_post)))
+    """,
+    # Classified topics of a forum
+    "topics_forum_classified_idx": """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS topics_forum_classified_idx
+        ON topics (forum_id) INCLUDE (topic_id)
+        WHERE classification_topic >= 0.5
+    """,
+    # max(dateadded_post) for the snapshot watermark
+    "posts_dateadded_idx": """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS posts_dateadded_idx
+        ON posts (dateadded_post)
+    """,
+}
+
+
+def prepare_schema():
+    """
+    Create the project indexes and refresh planner statistics and the visibility map
+    (needed for index-only scans). Safe to re-run.
+    """
+    with pooled_connection() as connection:
+        if connection is None:
+            return False
+
+        connection.autocommit = True
+        try:
+            with connection.cursor() as cursor:
+                for name, statement in SCHEMA_INDEXES.items():
+                    print(f"Creating index {name}...")
+                    cursor.execute(statement)
+                print("Vacuuming and analyzing posts, topics...")
+                cursor.execute("VACUUM (ANALYZE) posts")
+                cursor.execute("VACUUM (ANALYZE) topics")
+            return True
+        except Exception as error:
+            print(f"Error preparing schema: {error}")
+            return False
+        finally:
+            connection.autocommit = False
+
+
+def project_queries(forum_id):
+    """
+    (name, query, params) for the queries the pipeline runs against a forum.
+    The data_analysis scripts use the same posts/topics predicates.
+    """
+    params = scope_params(forum_id)
+    return [
+        ("build_thread_info", THREAD_POSTS_QUERY, params),
+        ("build_thread_info (bulk range)", THREAD_POSTS_RANGE_QUERY, {**params, "lo": 0, "hi": 2**31 - 1}),
+        ("build_thread_info (filters)", filtered_posts_query([0, 1, 2, 3]), params),
+        ("bulk topic ranges", TOPIC_RANGES_QUERY, (4, forum_id)),
+        ("apply_filters", FILTER_FLAGS_QUERY, params),
+        ("build_network_from_db nodes", NODE_QUERY.format(post_filters=""), params),
+        ("build_network_from_db edges", EDGE_AGGREGATE_QUERY.format(post_filters="", lag_filter=""), params),
+        ("snapshot watermark", WATERMARK_QUERY, None),
+    ]
+
+
+def _walk_plan(node, index_names, seq_scans):
+    if "Index Name" in node:
+        index_names.add(node["Index Name"])
+    if node.get("Node Type") == "Seq Scan":
+        seq_scans.add(node.get("Relation Name"))
+    for child in node.get("Plans", []):
+        _walk_plan(child, index_names, seq_scans)
+
+
+def explain_report(forum_id, analyze=False):
+    """
+    EXPLAIN each project query and print which indexes it uses, which tables are still
+    sequentially scanned, and its estimated cost (plus actual time with analyze=True).
+    """
+    rows = []
+    with pooled_connection() as connection:
+        if connection is None:
+            return rows
+
+        options = "FORMAT JSON, ANALYZE, BUFFERS" if analyze else "FORMAT JSON"
+        with connection.cursor() as cursor:
+            for name, query, params in project_queries(forum_id):
+                try:
+                    cursor.execute(f"EXPLAIN ({options}) {query}", params)
+                    plan = cursor.fetchone()[0][0]
+                except Exception as error:
+                    print(f"Error explaining {name}: {error}")
+                    connection.rollback()
+                    continue
+
+                index_names, seq_scans = set(), set()
+                _walk_plan(plan["Plan"], index_names, seq_scans)
+                rows.append({
+                    "query": name,
+                    "indexes": sorted(index_names),
+                    "seq_scans": sorted(seq_scans),
+                    "cost": plan["Plan"]["Total Cost"],
+                    "time_ms": plan.get("Execution Time"),
+                })
+
+    print(f"=== Query plans for forum {forum_id} ===")
+    for row in rows:
+        project = [i for i in row["indexes"] if i in SCHEMA_INDEXES]
+        others = [i for i in row["indexes"] if i not in SCHEMA_INDEXES]
+        timing = f", {row['time_ms']:.1f} ms" if row["time_ms"] is not None else ""
+        print(f"{row['query']:<32} cost={row['cost']:.1f}{timing}")
+        print(f"    project indexes: {', '.join(project) or '-'}"
+              f" | other indexes: {', '.join(others) or '-'}"
+              f" | seq scans: {', '.join(row['seq_scans']) or '-'}")
+    return rows
+
+
+if __name__ == "__main__":
+    # python schema.py prepare              → create indexes, vacuum/analyze
+    # python schema.py explain <forum_id>   → EXPLAIN report (add "analyze" to run the queries)
+    command = sys.argv[1] if len(sys.argv) > 1 else "explain"
+    if command == "prepare":
+        prepare_schema()
+    else:
+        forum_id = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+        explain_report(forum_id, analyze="analyze" in sys.argv[3:])
@@ -0,0 +1,41 @@
+import math
+
+
+def successive_halving(configs, evaluate, budgets, keep_fraction=0.5):
+    """
+    Screen configurations with growing sample budgets.
+
+    Every configuration is evaluated at budgets[0]; the best keep_fraction (by F1) move on to
+    the next budget, and so on until budgets[-1].
+
+    Args:
+        configs: List of configurations (anything evaluate accepts)
+        evaluate: Function (config, budget) → F1 score, or None if the model failed
+        budgets: Increasing sample budgets (max_pairs)
+        keep_fraction: Fraction of configurations kept after each budget (at least one is kept)
+
+    Returns:
+        One dict per configuration, in input order: config, f1_score (at the last budget it reached),
+        budget (that budget) and eliminated_at (budget it was dropped after; None if it reached the end).
+    """
+    results = {i: {"config": config, "f1_score": None, "budget": None, "eliminated_at": None}
+               for i, config in enumerate(configs)}
+    alive = list(results)
+
+    for rung, budget in enumerate(budgets):
+        print(f"\n=== Screening budget {budget}: {len(alive)} configurations ===")
+        for i in alive:
+            results[i]["f1_score"] = evaluate(results[i]["config"], budget)
+            results[i]["budget"] = budget
+
+        if rung == len(budgets) - 1:
+            break
+
+        keep = max(1, math.ceil(len(alive) * keep_fraction))
+        ranked = sorted(alive, key=lambda i: -1 if results[i]["f1_score"] is None else results[i]["f1_score"],
+                        reverse=True)
+        for i in ranked[keep:]:
+            results[i]["eliminated_at"] = budget
+        alive = sorted(ranked[:keep])
+
+    return [results[i] for i in range(len(configs))]
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# Default location of query snapshots, next to the code
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshots")
+
+
+class SnapshotStore:
+    """
+    On-disk cache of query results, one directory per (query, params) key.
+
+    Each column is stored as its own .npy file so numeric and datetime columns can be
+    memory-mapped on load; meta.json records the query, parameters, column order and the
+    posts watermark (max post_id, max dateadded_post) seen when the snapshot was taken.
+    A snapshot is stale, and ignored, once the database watermark moves past it.
+    """
+
+    def __init__(self, directory=SNAPSHOT_DIR):
+        self.directory = directory
+
+    @staticmethod
+    def key(query, params=None, namespace=""):
+        text = " ".join(query.split())
+        return hashlib.sha1(repr((namespace, text, params)).encode()).hexdigest()[:20]
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def load(self, key, watermark=None, mmap=True):
+        """
+        The stored frame for key, or None if there is none or it is older than watermark.
+        """
+        meta = self.meta(key)
+        if meta is None:
+            return None
+        if watermark is not None and tuple(meta["watermark"]) != tuple(watermark):
+            print(f"Snapshot {key} is stale (watermark {meta['watermark']} → {list(watermark)}).")
+            return None
+
+        columns = {}
+        for i, (name, kind) in enumerate(meta["columns"]):
+            file = os.path.join(self.path(key), f"{i}.npy")
+            if kind == "object":
+                columns[name] = np.load(file, allow_pickle=True)
+            else:
+                columns[name] = np.load(file, mmap_mode="r" if mmap else None)
+        return pd.DataFrame(columns, copy=False)
+
+    def save(self, key, df, watermark, query="", params=None):
+        """
+        Write df under key; the directory is swapped in atomically so readers never see half a snapshot.
+        """
+        tmp = self.path(key) + f".tmp{os.getpid()}"
+        os.makedirs(tmp, exist_ok=True)
+
+        columns = []
+        for i, name in enumerate(df.columns):
+            values = df[name].to_numpy()
+            kind = "object" if values.dtype.kind == "O" else "array"
+            np.save(os.path.join(tmp, f"{i}.npy"), values, allow_pickle=(kind == "object"))
+            columns.append((name, kind))
+
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump({"query": " ".join(query.split()), "params": repr(params), "columns": columns,
+                       "rows": len(df), "watermark": list(watermark), "created": time.time()}, f)
+
+        shutil.rmtree(self.path(key), ignore_errors=True)
+        os.replace(tmp, self.path(key))
+
+    def meta(self, key):
+        try:
+            with open(os.path.join(self.path(key), "meta.json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def keys(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(k for k in os.listdir(self.directory) if self.meta(k) is not None)
+
+    def invalidate(self, key=None):
+        """
+        Remove one snapshot, or all of them when key is None.
+        """
+        for k in ([key] if key is not None else self.keys()):
+            shutil.rmtree(self.path(k), ignore_errors=True)
+
+    def report(self):
+        print("=== Query snapshots ===")
+        for k in self.keys():
+            meta = self.meta(k)
+            print(f"{k}  rows={meta['rows']:<10} watermark={meta['watermark']}  {meta['query'][:80]} {meta['params']}")
+
+
+if __name__ == "__main__":
+    # python snapshot.py            → list snapshots
+    # python snapshot.py clear [key] → remove one or all snapshots
+    store = SnapshotStore()
+    if len(sys.argv) > 1 and sys.argv[1] == "clear":
+        store.invalidate(sys.argv[2] if len(sys.argv) > 2 else None)
+        print("Snapshots cleared.")
+    else:
+        store.report()
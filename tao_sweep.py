@@ -0,0 +1,182 @@
+import random
+from bisect import bisect_left, bisect_right
+
+import pandas as pd
+from tqdm import tqdm
+
+from indexes import build_forum_index, to_seconds
+from sampling import candidate_rng, negative_candidates, sample_rows, write_samples
+
+
+class ThresholdSweep:
+    """
+    Sampling engine for a whole (t_sus, t_fos) grid.
+
+    One pass at the largest window records, for every candidate v post (in seeded shuffle order):
+    - each potential v1 post with the minimal t_fos (t_v - t_v1) and t_sus (gap to v's closest
+      earlier cross-thread post) that makes it valid, and
+    - each potential negative post of v′ with the minimal t_sus (t_v1 - t_v′) it needs, for the
+      v1s picked at grid points that are still short of max_pairs.
+    Sampling at any grid point is then a threshold filter over these tables and gives the same
+    output as balanced_sampling(..., seed=seed) at that point.
+    """
+
+    def __init__(self, thread_info, G, tao_grid, max_pairs=600, seed=42, index=None):
+        """
+        Args:
+            tao_grid: List of (t_sus, t_fos) pairs in seconds that will be sampled
+            max_pairs: Maximum (v, v′) pairs per grid point, as in balanced_sampling
+            seed: Seed for the shuffle and negative choice, as in balanced_sampling
+        """
+        self.thread_info = thread_info
+        self.G = G
+        self.seed = seed
+        self.needed = max(1, -(-max_pairs // 2))
+        self.index = index if index is not None else build_forum_index(thread_info)
+        self.tao_grid = {(t_sus, t_fos) for t_sus, t_fos in tao_grid}
+        self.max_sus = max(t_sus for t_sus, _ in tao_grid)
+        self.max_fos = max(t_fos for _, t_fos in tao_grid)
+
+        # Same flattened list and shuffle as balanced_sampling
+        self.all_posts = []
+        for thread_id, posts in thread_info.items():
+            for post_id, user_id, timestamp in posts:
+                self.all_posts.append((thread_id, post_id, user_id, timestamp))
+        random.Random(seed).shuffle(self.all_posts)
+
+        self._build()
+
+    # --- Table construction ---
+    def _build(self):
+        """
+        Index posts in shuffle order until every grid point has accepted `needed` of them.
+
+        A post is accepted at (t_sus, t_fos) when the v1 balanced_sampling would pick there has a
+        negative within t_sus. The accepted count of each grid point is updated as each post is
+        indexed, and negatives are only recorded for v1s picked at a grid point still short of its
+        quota: posts past a point's quota are never part of its sample.
+        """
+        v1_rows, neg_rows = [], []
+        self.accepted = dict.fromkeys(self.tao_grid, 0)
+        self.indexed_posts = 0
+
+        for k in tqdm(range(len(self.all_posts)), desc="Indexing thresholds"):
+            open_points = [point for point, count in self.accepted.items() if count < self.needed]
+            if not open_points:
+                break
+            self._index_post(k, open_points, v1_rows, neg_rows)
+            self.indexed_posts = k + 1
+
+        self.v1_table = pd.DataFrame(v1_rows, columns=["order", "v1_rank", "v1_position", "fos_need", "sus_need"])
+        self.neg_table = pd.DataFrame(neg_rows, columns=["order", "v1_position", "v_prime_rank", "thread_rank",
+                                                         "position", "topic_id", "post_id", "sus_need"])
+        print(f"Threshold tables: {self.indexed_posts} posts indexed, {len(self.v1_table)} v1 rows, "
+              f"{len(self.neg_table)} negative rows.")
+
+    def _index_post(self, k, open_points, v1_rows, neg_rows):
+        index = self.index
+        thread_id, post_id_v, v_user, v_post_time = self.all_posts[k]
+        t_v = to_seconds(v_post_time)
+
+        # Potential v1 posts within the largest t_fos, earliest first
+        potential_v1s = []
+        for position, (pid1, u1, t1) in enumerate(self.thread_info[thread_id]):
+            t1 = to_seconds(t1)
+            if t1 < t_v and u1 != v_user and t_v - t1 <= self.max_fos:
+                potential_v1s.append((t1, position, u1))
+        potential_v1s.sort(key=lambda x: x[0])
+
+        # Step 1: minimal t_sus of each v1: latest cross-thread post of v at or before t1 where v1 posted earlier
+        times, threads = index.timeline.get(v_user, ([], []))[:2]
+        valid_v1s = []
+        for v1_rank, (t1, position, v1_user) in enumerate(potential_v1s):
+            for i in range(bisect_right(times, t1) - 1, bisect_left(times, t1 - self.max_sus) - 1, -1):
+                if threads[i] != thread_id and index.posted_in_thread_before(v1_user, threads[i], times[i]):
+                    valid_v1s.append((t1, position, v1_user, t_v - t1, t1 - times[i]))
+                    v1_rows.append((k, v1_rank, position, t_v - t1, t1 - times[i]))
+                    break
+
+        # Step 2: the v1 picked at each grid point still short of its quota (the earliest valid one)
+        chosen = {}
+        for t_sus, t_fos in open_points:
+            for v1 in valid_v1s:
+                if v1[3] <= t_fos and v1[4] <= t_sus:
+                    chosen[(t_sus, t_fos)] = v1
+                    break
+
+        # Step 3: negatives of the picked v1s, and the smallest t_sus any of them needs
+        negative_cache = {}
+        min_neg_sus = {}
+        for t1, position, v1_user, _, _ in set(chosen.values()):
+            if v1_user not in negative_cache:
+                negative_cache[v1_user] = list(negative_candidates(self.G, index, v1_user, v_user, thread_id, t_v))
+
+            for v_prime_rank, v_prime in enumerate(negative_cache[v1_user]):
+                entry = index.timeline.get(v_prime)
+                if entry is None:
+                    continue
+                p_times, p_threads, p_post_ids, p_positions = entry
+                for i in range(bisect_left(p_times, t1 - self.max_sus), bisect_right(p_times, min(t1, t_v - 1))):
+                    if p_threads[i] != thread_id:
+                        neg_rows.append((k, position, v_prime_rank, index.thread_rank[p_threads[i]],
+                                         p_positions[i], p_threads[i], p_post_ids[i], t1 - p_times[i]))
+                        min_neg_sus[position] = min(min_neg_sus.get(position, t1 - p_times[i]), t1 - p_times[i])
+
+        # Step 4: count the post at every grid point where its v1 has a negative within t_sus
+        for (t_sus, t_fos), v1 in chosen.items():
+            if min_neg_sus.get(v1[1], t_sus + 1) <= t_sus:
+                self.accepted[(t_sus, t_fos)] += 1
+
+    # --- Threshold filters ---
+    def _chosen_v1(self, t_sus, t_fos):
+        valid = self.v1_table[(self.v1_table["fos_need"] <= t_fos) & (self.v1_table["sus_need"] <= t_sus)]
+        return valid.sort_values(["order", "v1_rank"]).drop_duplicates("order")
+
+    def _negatives(self, t_sus, t_fos):
+        """
+        Valid negatives per v under the thresholds: v′'s first qualifying post per other thread,
+        ordered like balanced_sampling's valid_negatives.
+        """
+        chosen = self._chosen_v1(t_sus, t_fos)[["order", "v1_position"]]
+        negs = self.neg_table[self.neg_table["sus_need"] <= t_sus].merge(chosen, on=["order", "v1_position"])
+        negs = negs.sort_values(["order", "v_prime_rank", "thread_rank", "position"])
+        return negs.drop_duplicates(["order", "v_prime_rank", "thread_rank"])
+
+    def sample(self, t_sus, t_fos, balanced_output="outputs/balanced_samples.csv",
+               imbalanced_output="outputs/imbalanced_samples.csv", max_pairs=None,
+               negatives_output="outputs/negatives_per_positive.csv"):
+        """
+        Write the balanced/imbalanced sample CSVs for one grid point (t_sus, t_fos in seconds,
+        one of the points given at construction). A smaller max_pairs than the one given at
+        construction returns the same prefix balanced_sampling would.
+        """
+        needed = self.needed if max_pairs is None else min(self.needed, max(1, -(-max_pairs // 2)))
+        # Indexing stops once every grid point has its quota, so points off the grid may be under-sampled
+        if (t_sus, t_fos) not in self.tao_grid:
+            raise ValueError(f"TAO ({t_sus}, {t_fos}) is not a point of the indexed grid.")
+
+        negs = self._negatives(t_sus, t_fos)
+        chosen = self._chosen_v1(t_sus, t_fos).set_index("order")["v1_position"]
+        orders = negs["order"].drop_duplicates().tolist()[:needed]
+        negs = negs[negs["order"].isin(orders)]
+
+        accepted = []
+        for k, group in negs.groupby("order", sort=True):
+            candidate = self.all_posts[k]
+            thread_id = candidate[0]
+            post_id_v1, v1_user, v1_post_time = self.thread_info[thread_id][int(chosen[k])]
+            v_primes = self._v_primes(k, v1_user)
+            valid_negatives = [
+                (v_primes[v_prime_rank], post_id, self.thread_info[topic_id][position][2])
+                for v_prime_rank, topic_id, position, post_id in zip(
+                    group["v_prime_rank"].tolist(), group["topic_id"].tolist(),
+                    group["position"].tolist(), group["post_id"].tolist())
+            ]
+            accepted.append(sample_rows(candidate, post_id_v1, v1_user, v1_post_time, valid_negatives,
+                                        candidate_rng(self.seed, candidate[1])))
+
+        return write_samples(accepted, balanced_output, imbalanced_output, negatives_output)
+
+    def _v_primes(self, k, v1_user):
+        thread_id, _, v_user, v_post_time = self.all_posts[k]
+        return list(negative_candidates(self.G, self.index, v1_user, v_user, thread_id, to_seconds(v_post_time)))
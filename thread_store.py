@@ -0,0 +1,187 @@
+import os
+import sys
+from collections import OrderedDict
+
+import numpy as np
+
+from indexes import to_seconds
+
+ARRAY_NAMES = ["topic_ids", "offsets", "post_ids", "user_ids", "times"]
+
+# Threads whose materialized post lists are kept (least recently used ones are dropped)
+LIST_CACHE_SIZE = 1024
+
+
+class ThreadInfo:
+    """
+    Compact, array-backed replacement for the thread_info dict.
+
+    Posts are stored in contiguous int64 arrays (post_ids, user_ids, times as epoch seconds),
+    grouped by thread: posts of topic_ids[i] are the slice offsets[i]:offsets[i + 1], time-sorted.
+    Behaves like the dict form: thread_info[topic_id] and items() yield lists of
+    (post_id, user_id, time) tuples, with time as int epoch seconds. The lists of the
+    cache_size most recently used threads are kept (sampling reads a thread once per candidate);
+    cache_size=0 disables this, clear_cache() drops them.
+    """
+
+    def __init__(self, topic_ids, offsets, post_ids, user_ids, times, cache_size=LIST_CACHE_SIZE):
+        self.topic_ids = topic_ids
+        self.offsets = offsets
+        self.post_ids = post_ids
+        self.user_ids = user_ids
+        self.times = times
+        self._position = {topic_id: i for i, topic_id in enumerate(np.asarray(topic_ids).tolist())}
+        self.cache_size = cache_size
+        self._lists = OrderedDict()  # topic_id → materialized post list, least recently used first
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        Build from a build_network.ThreadArrays (or any object with the same fields); no copies.
+        """
+        return cls(*(getattr(arrays, name) for name in ARRAY_NAMES))
+
+    @classmethod
+    def from_dict(cls, thread_info):
+        """
+        Convert the dict form {topic_id: [(post_id, user_id, timestamp), ...]}.
+        """
+        topic_ids, offsets, post_ids, user_ids, times = [], [0], [], [], []
+        for topic_id, posts in thread_info.items():
+            posts = sorted(posts, key=lambda x: to_seconds(x[2]))
+            topic_ids.append(topic_id)
+            for post_id, user_id, post_time in posts:
+                post_ids.append(post_id)
+                user_ids.append(user_id)
+                times.append(to_seconds(post_time))
+            offsets.append(len(post_ids))
+
+        return cls(np.array(topic_ids, dtype=np.int64), np.array(offsets, dtype=np.int64),
+                   np.array(post_ids, dtype=np.int64), np.array(user_ids, dtype=np.int64),
+                   np.array(times, dtype=np.int64))
+
+    # --- On-disk backing ---
+    def save(self, directory):
+        """
+        Write one .npy file per array so the store can be memory-mapped later.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAY_NAMES:
+            np.save(os.path.join(directory, f"{name}.npy"), np.asarray(getattr(self, name)))
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+        Load a saved store; with mmap=True the post arrays stay on disk and are paged in on access.
+        """
+        mode = "r" if mmap else None
+        return cls(*(np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mode) for name in ARRAY_NAMES))
+
+    # --- Array access ---
+    def thread_arrays(self, topic_id):
+        """
+        (post_ids, user_ids, times) slices of one thread, without copying.
+        """
+        i = self._position[topic_id]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.post_ids[start:end], self.user_ids[start:end], self.times[start:end]
+
+    def num_posts(self):
+        return len(self.post_ids)
+
+    # --- Dict-compatible API ---
+    def __getitem__(self, topic_id):
+        posts = self._lists.get(topic_id)
+        if posts is not None:
+            self._lists.move_to_end(topic_id)
+            return posts
+
+        post_ids, user_ids, times = self.thread_arrays(topic_id)
+        posts = list(zip(post_ids.tolist(), user_ids.tolist(), times.tolist()))
+        if self.cache_size > 0:
+            self._lists[topic_id] = posts
+            if len(self._lists) > self.cache_size:
+                self._lists.popitem(last=False)
+        return posts
+
+    def clear_cache(self):
+        self._lists.clear()
+
+    def cache_nbytes(self):
+        """
+        Approximate size of the cached post lists (same accounting as dict_nbytes).
+        """
+        return dict_nbytes(self._lists) - sys.getsizeof(self._lists)
+
+    def __contains__(self, topic_id):
+        return topic_id in self._position
+
+    def __iter__(self):
+        return iter(self._position)
+
+    def __len__(self):
+        return len(self._position)
+
+    def keys(self):
+        return self._position.keys()
+
+    def values(self):
+        for topic_id in self._position:
+            yield self[topic_id]
+
+    def items(self):
+        for topic_id in self._position:
+            yield topic_id, self[topic_id]
+
+    def get(self, topic_id, default=None):
+        return self[topic_id] if topic_id in self._position else default
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def nbytes(self):
+        return sum(np.asarray(getattr(self, name)).nbytes for name in ARRAY_NAMES)
+
+
+def dict_nbytes(thread_info):
+    """
+    Approximate in-memory size of the dict form: dict, lists, tuples and their ids/timestamps.
+    """
+    total = sys.getsizeof(thread_info)
+    for topic_id, posts in thread_info.items():
+        total += sys.getsizeof(topic_id) + sys.getsizeof(posts)
+        for post in posts:
+            total += sys.getsizeof(post) + sum(sys.getsizeof(x) for x in post)
+    return total
+
+
+def memory_report(thread_info, store=None):
+    """
+    Compare the footprint of the dict form against the array-backed ThreadInfo.
+    """
+    if store is None:
+        store = ThreadInfo.from_dict(thread_info)
+
+    num_posts = store.num_posts()
+    dict_size = dict_nbytes(thread_info)
+    store_size = store.nbytes()
+    cache_size = store.cache_nbytes()
+
+    print("=== thread_info memory footprint ===")
+    print(f"Threads: {len(store)}, posts: {num_posts}")
+    print(f"dict form:  {dict_size / 2**20:10.2f} MiB ({dict_size / max(num_posts, 1):.1f} bytes/post)")
+    print(f"ThreadInfo: {store_size / 2**20:10.2f} MiB ({store_size / max(num_posts, 1):.1f} bytes/post)"
+          f" + {cache_size / 2**20:.2f} MiB cached lists ({len(store._lists)} of at most {store.cache_size} threads)")
+    print(f"Reduction:  {dict_size / max(store_size + cache_size, 1):10.1f}x")
+
+    return {"threads": len(store), "posts": num_posts, "dict_bytes": dict_size, "thread_info_bytes": store_size,
+            "cache_bytes": cache_size}
+
+
+if __name__ == "__main__":
+    from build_network import build_thread_info
+
+    forum_id = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    thread_info = build_thread_info(forum_id)
+    if thread_info:
+        memory_report(thread_info)